@@ -0,0 +1,121 @@
+import argparse
+import cache
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import storage
+
+# Cross-user analytics over every account under data/, for admins. Each user's history is
+# summarized in a worker process (per measurement: readings, sum, sum of squares, min,
+# max, first and latest reading, monthly sums and counts) and the per-user summaries are
+# merged into a cohort summary. Summaries are kept in data/analytics.json together with
+# the (mtime, size) signature of the files they were computed from, so a rerun only
+# re-reads the users whose health data changed since the last scan.
+#   python analytics.py [--workers N] [--full] [--output cohort.json]
+SUMMARY_FILE = "data/analytics.json"
+PERCENTILES = [0.1, 0.5, 0.9]  # Of each user's latest reading, per measurement
+
+def user_emails():
+    return sorted(e for e in os.listdir("data") if os.path.isdir(f"data/{e}") and storage.get_backend(e).exists())
+
+def file_signature(email):
+    # JSON form of cache.signature, so it compares equal after a round trip through the manifest.
+    return [list(s) for s in cache.signature(storage.get_backend(email).files())]
+
+def summarize_user(email):
+    # Runs in a worker process: reads the store directly, bypassing the per-process cache.
+    df = storage.get_backend(email).read()
+    df = df[df["Value"].notna()]
+    if df.empty: return {}
+    month = df["Date"].to_numpy(dtype="datetime64[M]")  # Formatted per month below, not per row
+    df = df.assign(Square=df["Value"] ** 2, Month=month).sort_values("Date", kind="stable")
+    by_name = df.groupby("Name", sort=True)
+    stats = by_name.agg(count=("Value", "size"), sum=("Value", "sum"), sumsq=("Square", "sum"), min=("Value", "min"),
+                        max=("Value", "max"), units=("Units", "last"), first=("Date", "first"), latest=("Date", "last"),
+                        latest_value=("Value", "last"))
+    monthly = df.groupby(["Name", "Month"], sort=True)["Value"].agg(["sum", "count"])
+    summary = {}
+    for name, row in stats.iterrows():
+        months = monthly.loc[name]
+        summary[name] = {
+            "units": None if pd.isna(row["units"]) else row["units"], "count": int(row["count"]),
+            "sum": float(row["sum"]), "sumsq": float(row["sumsq"]), "min": float(row["min"]), "max": float(row["max"]), "latest_value": float(row["latest_value"]),
+            "first": row["first"].isoformat(), "latest": row["latest"].isoformat(),
+            "monthly": { str(m)[:7]: [float(s), int(c)] for m, s, c in zip(months.index.to_numpy(dtype="datetime64[M]"),
+                                                                           months["sum"], months["count"]) },
+        }
+    return summary
+
+def _read_summaries():
+    try:
+        with open(SUMMARY_FILE) as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def scan(workers=None, full=False):
+    # Bring every user's summary up to date; returns (summaries by email, scan stats).
+    start = time.perf_counter()
+    saved = {} if full else _read_summaries()
+    emails = user_emails()
+    signatures = { email: file_signature(email) for email in emails }
+    stale = [e for e in emails if e not in saved or saved[e]["signature"] != signatures[e]]
+    if stale:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(stale) // (workers * 4))  # Batches keep per-task overhead low with thousands of users
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for email, summary in zip(stale, pool.map(summarize_user, stale, chunksize=chunksize)):
+                saved[email] = { "signature": signatures[email], "summary": summary }
+    summaries = { email: saved[email] for email in emails }  # Drops users that were removed
+    if stale or len(summaries) != len(saved):
+        storage.atomic_write(SUMMARY_FILE, lambda f: json.dump(summaries, f))
+    seconds = time.perf_counter() - start
+    return ({ email: entry["summary"] for email, entry in summaries.items() },
+            { "users": len(emails), "scanned": len(stale), "reused": len(emails) - len(stale), "seconds": seconds })
+
+def cohort(summaries):
+    # Merge per-user summaries into cohort tables:
+    #   measurements  one row per measurement: users, readings, mean/std over all readings,
+    #                 min/max, and percentiles of each user's latest reading
+    #   monthly       Month x measurement mean over all users' readings
+    #   latest        user x measurement latest reading
+    rows = [{ "Email": email, "Name": name, **{ k: v for k, v in s.items() if k != "monthly" } }
+            for email, summary in summaries.items() for name, s in summary.items()]
+    if not rows:
+        return { "measurements": pd.DataFrame(), "monthly": pd.DataFrame(), "latest": pd.DataFrame() }
+    per_user = pd.DataFrame(rows)
+    grouped = per_user.groupby("Name", sort=True)
+    measurements = grouped.agg(units=("units", "first"), users=("Email", "size"), readings=("count", "sum"),
+                               sum=("sum", "sum"), sumsq=("sumsq", "sum"), min=("min", "min"), max=("max", "max"),
+                               latest=("latest", "max"))
+    measurements["units"] = measurements["units"].fillna("")
+    measurements["mean"] = measurements["sum"] / measurements["readings"]
+    variance = measurements["sumsq"] / measurements["readings"] - measurements["mean"] ** 2
+    measurements["std"] = np.sqrt(variance.clip(lower=0))
+    latest_values = grouped["latest_value"].quantile(PERCENTILES).unstack()
+    latest_values.columns = [f"latest_p{round(q * 100)}" for q in PERCENTILES]
+    measurements = measurements.drop(columns=["sum", "sumsq"]).join(latest_values)
+
+    monthly = pd.DataFrame([(name, month, s, c) for summary in summaries.values() for name, m in summary.items()
+                            for month, (s, c) in m["monthly"].items()], columns=["Name", "Month", "sum", "count"])
+    monthly = monthly.groupby(["Month", "Name"], sort=True)[["sum", "count"]].sum()
+    monthly = (monthly["sum"] / monthly["count"]).unstack("Name")
+
+    latest = per_user.pivot(index="Email", columns="Name", values="latest_value")
+    return { "measurements": measurements, "monthly": monthly, "latest": latest }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize health data across all users under data/.")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--full", action="store_true", help="Re-read every user instead of only changed ones")
+    parser.add_argument("--output", help="Write the cohort tables to this JSON file")
+    args = parser.parse_args()
+    summaries, stats = scan(args.workers, args.full)
+    tables = cohort(summaries)
+    print(f"{stats['users']:,} users: {stats['scanned']:,} scanned, {stats['reused']:,} unchanged, {stats['seconds']:.2f}s")
+    if not tables["measurements"].empty: print(tables["measurements"].round(2).to_string())
+    if args.output:
+        text = json.dumps({ k: json.loads(v.to_json(orient="split", date_format="iso")) for k, v in tables.items() }, indent=4)
+        with open(args.output, "w") as f: f.write(text + "\n")
@@ -1,8 +1,9 @@
-import json
-import os
-import pandas as pd
+import storage
 import streamlit as st
+import timing
+import users
 
+@timing.traced("auth.check_password")
 def check_password():
     if "authenticated" not in st.session_state:
         st.session_state["authenticated"] = False
@@ -24,17 +25,11 @@ def login():
     password = st.text_input("Password", type="password")
     login_btn = st.button("Login")
     if login_btn:
-        users = pd.read_csv("data/users.csv")
-        user_row = users[users["email"] == email]
-        if not user_row.empty:
-            pw = user_row.iloc[0]["password"]
-            if password == pw:
-                st.session_state["authenticated"] = True
-                st.session_state["email"] = email
-                st.success("Login successful!")
-                st.rerun()
-            else:
-                st.error("Invalid email or password.")
+        if users.store.check(email, password):
+            st.session_state["authenticated"] = True
+            st.session_state["email"] = email
+            st.success("Login successful!")
+            st.rerun()
         else:
             st.error("Invalid email or password.")
 
@@ -51,21 +46,11 @@ def signup():
         elif password != confirm:
             st.error("Passwords do not match.")
         else:
-            # Save new user (append to users.csv)
-            users_file = "data/users.csv"
-            if not os.path.exists(users_file):
-                pd.DataFrame([{"email": email, "password": password}]).to_csv(users_file, index=False)
-            else:
-                users = pd.read_csv(users_file)
-                if email in users["email"].values:
-                    st.error("Email already exists.")
-                    return
-                users = pd.concat([users, pd.DataFrame([{"email": email, "password": password}])], ignore_index=True)
-                users.to_csv(users_file, index=False)
-            os.makedirs(f"data/{email}", exist_ok=True)
-            health_data_file = f"data/{email}/health_data.csv"
-            if not os.path.exists(health_data_file):
-                pd.DataFrame(columns=["Name", "Value", "Units", "Date", "Note"]).to_csv(health_data_file, index=False)
+            # Save new user (atomically rewrites users.csv under a lock)
+            if not users.store.add(email, password):
+                st.error("Email already exists.")
+                return
+            storage.create_user_data(email)  # Empty store in the default backend
             st.success("Account created! Please log in.")
             st.stop()
 
@@ -0,0 +1,73 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import pandas as pd
+
+# Hammers one user's store from many threads (and optionally processes) with appends,
+# settings saves and compactions, then checks that no row or setting was lost.
+#   python -m bench.concurrent_writes --threads 16 --writes 50 --backend csv
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import settings
+import storage
+
+EMAIL = "bench@example.com"
+
+def writer(worker, writes):
+    for i in range(writes):
+        row = { "Date": pd.Timestamp("2024-01-01") + pd.Timedelta(minutes=i), "Name": "Weight",
+                "Value": float(i), "Units": "lbs", "Note": f"{worker}:{i}" }
+        storage.append_entries(EMAIL, pd.DataFrame([row]))
+        if i % 10 == 0: settings.save_settings(EMAIL, { f"worker_{worker}": i })
+        if i % 25 == 0: storage.compact(EMAIL)
+
+def process_writer(root, first_worker, threads, writes):
+    os.chdir(root)
+    run_threads(first_worker, threads, writes)
+
+def run_threads(first_worker, threads, writes):
+    workers = [threading.Thread(target=writer, args=(first_worker + t, writes)) for t in range(threads)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent write throughput and lost-row check.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--writes", type=int, default=50, help="Appends per thread")
+    parser.add_argument("--backend", default="csv", choices=sorted(storage.backends))
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="health-bench-")
+    os.chdir(root)
+    storage.get_backend(EMAIL, args.backend).create()
+    start = time.perf_counter()
+    if args.processes == 1:
+        run_threads(0, args.threads, args.writes)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=process_writer, args=(root, p * args.threads, args.threads, args.writes))
+                 for p in range(args.processes)]
+        for p in procs: p.start()
+        for p in procs: p.join()
+    elapsed = time.perf_counter() - start
+
+    workers = args.processes * args.threads
+    expected = { f"{w}:{i}" for w in range(workers) for i in range(args.writes) }
+    df = storage.get_backend(EMAIL).read()
+    notes = set(df["Note"])
+    saved = settings.load_settings(EMAIL)
+    lost_settings = [w for w in range(workers) if f"worker_{w}" not in saved]
+    print(f"{args.backend}: {len(expected)} appends from {workers} writers in {elapsed:.2f}s "
+          f"({len(expected) / elapsed:,.0f} appends/s), {len(df)} rows stored")
+    if len(df) != len(expected) or notes != expected or lost_settings:
+        print(f"FAILED: {len(expected - notes)} lost rows, {len(df) - len(notes)} duplicates, "
+              f"{len(lost_settings)} lost settings")
+        sys.exit(1)
+    print("OK: no lost rows or settings")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Synthetic users for benchmarks: each user gets years of readings from the entry types
+# in profiles.py (a daily body-composition weigh-in, blood pressure most days, glucose and
+# ketone a few times a week, a quarterly lipid panel), with slow trends and noise.
+#   python -m bench.generate --root /tmp/health-bench --users 20 --years 5
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profiles
+import storage
+
+def _readings(rng, dates, base, trend, noise):
+    return base + trend * np.linspace(0, 1, len(dates)) + rng.normal(0, noise, len(dates))
+
+def user_frame(rng, years, end=pd.Timestamp("2025-07-01")):
+    days = pd.date_range(end - pd.DateOffset(years=years), end, freq="D")
+    jitter = lambda d: d + pd.to_timedelta(rng.integers(6 * 60, 22 * 60, len(d)), unit="min")
+    frames = []
+    # Daily GE CS10G weigh-in: weight, body fat %, bmi, muscle, bmr, fat-free, visceral, water %, bone
+    d = jitter(days)
+    w = _readings(rng, d, rng.uniform(140, 220), rng.uniform(-20, 10), 1.5)
+    values = np.column_stack([w, _readings(rng, d, 25, -3, 0.8), w * 703 / 66**2, w * 0.4, 1500 + w * 2,
+                              w * 0.75, _readings(rng, d, 9, -1, 0.5), _readings(rng, d, 55, 1, 1), w * 0.04])
+    frames.append(profiles.evaluate("GE CS10G", values, d))
+    d = jitter(days[rng.random(len(days)) < 0.7])
+    values = np.column_stack([_readings(rng, d, 125, -5, 8), _readings(rng, d, 80, -3, 5), _readings(rng, d, 68, 0, 6)])
+    frames.append(profiles.evaluate("Systolic Diastolic Pulse", values, d))
+    d = jitter(days[rng.random(len(days)) < 0.4])
+    values = np.column_stack([_readings(rng, d, 90, -5, 10), np.abs(_readings(rng, d, 1.0, 0.5, 0.6)) + 0.1])
+    frames.append(profiles.evaluate("Glucose Ketone", values, d))
+    d = jitter(days[::90])
+    values = np.column_stack([_readings(rng, d, 200, -10, 15), _readings(rng, d, 120, -20, 20),
+                              _readings(rng, d, 50, 5, 4), _readings(rng, d, 120, -10, 12)])
+    frames.append(profiles.evaluate("Cholesterol Triglycerides HDL LDL", values, d))
+    return pd.concat(frames, ignore_index=True)
+
+def generate(root, users=10, years=5, backend="csv", seed=0):
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        rng = np.random.default_rng(seed)
+        emails = [f"user{i:05d}@example.com" for i in range(users)]
+        rows = 0
+        for email in emails:
+            df = user_frame(rng, years)
+            target = storage.get_backend(email, backend)
+            target.create()
+            target.replace(df)
+            with open(f"data/{email}/settings.json", "w") as f:
+                json.dump({ "height": 66.0 }, f, indent=4)
+            rows += len(df)
+        with open("data/users.csv", "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["email", "password"])
+            writer.writerows((email, "password") for email in emails)
+    finally:
+        os.chdir(cwd)
+    return emails, rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic health data users.")
+    parser.add_argument("--root", required=True, help="Directory to create data/ in")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--backend", default="csv", choices=sorted(storage.backends))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    emails, rows = generate(args.root, args.users, args.years, args.backend, args.seed)
+    print(f"Generated {len(emails)} users, {rows:,} rows under {args.root}/data")
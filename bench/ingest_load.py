@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+# Load test for ingest.py: starts the server on synthetic users (see bench/generate.py),
+# then keep-alive clients post Weight readings as fast as the server answers. Reports
+# sustained requests/s, latency percentiles and how many appends the coalescer made, and
+# checks that every acknowledged reading was stored.
+#   python -m bench.ingest_load --users 4 --clients 64 --requests 5000
+#   python -m bench.ingest_load --max-batch 1   # one append per request (no coalescing)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import storage
+from bench.generate import generate
+
+async def request(reader, writer, method, path, body=b"", headers=""):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length": length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def client(port, email, requests, start, latencies, failures):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    auth = "Authorization: Basic " + base64.b64encode(f"{email}:password".encode()).decode() + "\r\n"
+    for i in range(requests):
+        date = (start + timedelta(seconds=i)).isoformat()
+        body = json.dumps({ "type": "Weight", "values": [150 + i % 50 / 10], "date": date, "note": "load" }).encode()
+        sent = time.perf_counter()
+        status, _ = await request(reader, writer, "POST", "/readings", body, auth)
+        latencies.append(time.perf_counter() - sent)
+        if status != 201: failures.append(status)
+    writer.close()
+
+async def run(port, emails, clients, requests):
+    latencies, failures = [], []
+    tasks = [client(port, emails[c % len(emails)], requests // clients + (c < requests % clients), datetime(2030, 1, 1) + timedelta(days=c),
+                    latencies, failures) for c in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    _, health = await request(reader, writer, "GET", "/health")
+    writer.close()
+    return latencies, failures, elapsed, health
+
+async def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline: raise
+            await asyncio.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ingestion API.")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--years", type=int, default=1, help="Existing history per user")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=5000, help="Total requests")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--max-batch", type=int, default=5000, help="Server readings per append (1: no coalescing)")
+    parser.add_argument("--linger-ms", type=float, default=5.0, help="Server wait for more readings before each batch")
+    parser.add_argument("--backend", default="csv", choices=sorted(storage.backends))
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="health-bench-")
+    server = None
+    try:
+        emails, _ = generate(root, args.users, args.years, args.backend)
+        os.chdir(root)
+        before = { email: len(storage.get_backend(email).read()) for email in emails }
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "ingest.py"), "--port", str(args.port),
+                                   "--max-batch", str(args.max_batch), "--linger-ms", str(args.linger_ms)], cwd=root, stdout=subprocess.DEVNULL)
+        asyncio.run(wait_for(args.port))
+        latencies, failures, elapsed, health = asyncio.run(run(args.port, emails, args.clients, args.requests))
+        stored = sum(len(storage.get_backend(email).read()) - before[email] for email in emails)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        os.chdir(ROOT)
+        shutil.rmtree(root, ignore_errors=True)
+
+    ms = np.array(latencies) * 1000
+    report = {
+        "config": vars(args),
+        "requests": len(latencies),
+        "failures": len(failures),
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_ms": { f"p{p}": round(float(np.percentile(ms, p)), 2) for p in (50, 90, 99) } | { "max": round(float(ms.max()), 2) },
+        "appends": health["batches"],
+        "requests_per_append": round(health["requests"] / health["batches"], 1) if health["batches"] else None,
+        "rows_stored": stored,
+        "rows_acknowledged": health["readings"] * 2,  # Weight readings store Weight and BMI
+    }
+    print(json.dumps(report, indent=4))
+    if failures or stored != report["rows_acknowledged"]:
+        print(f"FAILED: {len(failures)} failed requests, {report['rows_acknowledged'] - stored} acknowledged rows missing")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import pandas as pd
+
+# Memory report for one synthetic user (see bench/generate.py):
+#   frame     deep size of the loaded rows as read from storage vs the compact cached frame
+#   rerun     peak allocation of the chart/table path, old (reset_index + melt + full table
+#             copy formatted as strings) vs current (long_frame + one table page)
+#   sessions  Python allocations kept per additional AppTest session of the same user,
+#             which share the cached frame and views instead of holding their own copies
+#   python -m bench.memory --years 10 --sessions 4
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import cache
+import home
+import storage
+import views
+from bench.generate import generate
+
+NAMES = ["Weight", "Body Fat %", "Systolic", "Diastolic", "Glucose", "Cholesterol"]
+
+def peak(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def frame_report(email):
+    raw = storage.get_backend(email).read()
+    df = storage.load_health_data(email)
+    return { "rows": len(df), "raw_bytes": int(raw.memory_usage(deep=True).sum()),
+             "compact_bytes": int(df.memory_usage(deep=True).sum()) }
+
+def rerun_report(email):
+    df = storage.load_health_data(email)
+    view = views.wide_view(email, df)
+    df_reshaped = view.slice(None, None, NAMES).ffill()
+
+    def legacy():
+        df_chart = pd.melt(df_reshaped.reset_index(), id_vars="Date", var_name="Name", value_name="Value")
+        df_display = df_reshaped.copy()
+        df_display = df_display.sort_index(ascending=False).reset_index()
+        df_display["Date"] = df_display["Date"].dt.strftime("%Y-%m-%d")
+        return df_chart, df_display.astype(str)
+
+    def current():
+        return home.long_frame(df_reshaped), home.table_page(df_reshaped, 1, home.page_sizes[0])
+
+    return { "rows": len(df_reshaped), "legacy_peak_bytes": peak(legacy), "current_peak_bytes": peak(current) }
+
+def session_report(email, sessions):
+    from streamlit.testing.v1 import AppTest
+    cache.health_data.clear()
+    apps = []
+    sizes = []
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(sessions):
+            at = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=120)
+            at.session_state["authenticated"] = True
+            at.session_state["email"] = email
+            at.run()
+            if at.exception: raise RuntimeError(at.exception[0].message)
+            apps.append(at)  # Keep every session alive, as a server would
+            gc.collect()
+            sizes.append(tracemalloc.get_traced_memory()[0] - base)
+    finally:
+        tracemalloc.stop()
+    marginal = [b - a for a, b in zip(sizes, sizes[1:])]
+    return { "sessions": sessions, "first_session_bytes": sizes[0],
+             "per_extra_session_bytes": int(sum(marginal) / len(marginal)) if marginal else None }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report in-memory footprint per user and per session.")
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--backend", default="csv", choices=sorted(storage.backends))
+    parser.add_argument("--output", help="Write the report JSON here instead of stdout")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="health-bench-")
+    try:
+        emails, _ = generate(root, 1, args.years, args.backend)
+        os.chdir(root)
+        report = {
+            "config": { "years": args.years, "backend": args.backend },
+            "frame": frame_report(emails[0]),
+            "rerun": rerun_report(emails[0]),
+            "sessions": session_report(emails[0], args.sessions),
+        }
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(root, ignore_errors=True)
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
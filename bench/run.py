@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import pandas as pd
+
+# Timed, repeatable scenarios over synthetic users (see bench/generate.py), covering each
+# stage of a Home rerun plus a New Entry write and a login, and full headless reruns of
+# the app through Streamlit's AppTest. Results are printed (or written) as JSON; with
+# --compare, any scenario whose median is more than --threshold times the baseline's fails.
+#   python -m bench.run --users 5 --years 5 --output results.json
+#   python -m bench.run --compare results.json --threshold 1.5
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import cache
+import downsample
+import home
+import profiles
+import rolling
+import rollups
+import storage
+import users
+import views
+from bench.generate import generate
+
+NAMES = ["Weight", "Body Fat %", "Systolic", "Diastolic", "Glucose", "Cholesterol"]
+
+def timed(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "min_ms": round(times[0], 3),
+        "repeat": repeat,
+    }
+
+def clear_caches():
+    cache.health_data.clear()
+    for email in os.listdir("data"):
+        if os.path.exists(views.view_file(email)): os.remove(views.view_file(email))
+
+def scenarios(email, repeat):
+    df = storage.load_health_data(email)
+    view = views.wide_view(email, df)
+    end = view.sums.index[-1] + pd.DateOffset(days=1)
+    start = end - pd.DateOffset(years=2)
+    df_reshaped = view.slice(start, end, NAMES).ffill()
+    df_chart = home.long_frame(df_reshaped)
+    reading = [180.0, 24.0, 29.0, 72.0, 1860.0, 135.0, 9.0, 55.0, 7.2]
+    writes = iter(range(repeat * 2))
+
+    def home_pipeline():
+        df_reshaped = view.slice(start, end, NAMES).ffill()
+        home.long_frame(df_reshaped)
+
+    def weekly_pipeline():
+        # All history at weekly resolution, as Auto picks for multi-year ranges.
+        df_reshaped = rollups.rollup(email, "W", df).slice(None, end, NAMES).ffill()
+        home.long_frame(df_reshaped)
+
+    def legacy_pipeline():
+        # The filter/pivot/ffill/melt block as it was before the maintained wide view.
+        df_filtered = df[(df["Name"].isin(NAMES)) & (df["Date"] >= start) & (df["Date"] < end)]
+        df_reshaped = df_filtered.pivot_table(index="Date", columns="Name", values="Value", aggfunc="mean")
+        df_reshaped = df_reshaped.sort_values(by="Date", ascending=False).ffill()
+        pd.melt(df_reshaped.reset_index(), id_vars="Date", var_name="Name", value_name="Value")
+
+    def legacy_rolling():
+        df_reshaped.rolling("30D").mean()
+
+    def new_entry():
+        # A dated reading far from the synthetic range, so each write is a new row.
+        date = pd.Timestamp("2030-01-01") + pd.Timedelta(minutes=next(writes))
+        storage.append_entries(email, profiles.evaluate("GE CS10G", reading, date))
+
+    def login_cold():
+        users.store._signature = None
+        users.store.check(email, "password")
+
+    results = {
+        "load_cold": timed(lambda: storage.load_health_data(email), repeat, setup=clear_caches),
+        "load_warm": timed(lambda: storage.load_health_data(email), repeat),
+        "wide_view_cold": timed(lambda: views.wide_view(email, df), repeat, setup=clear_caches),
+        "wide_view_warm": timed(lambda: views.wide_view(email, df), repeat),
+        "home_pipeline": timed(home_pipeline, repeat),
+        "home_pipeline_legacy": timed(legacy_pipeline, repeat),
+        "rollup_cold": timed(lambda: rollups.rollup(email, "W", df), repeat,
+                             setup=lambda: cache.health_data.invalidate(email, "rollup_W")),
+        "home_pipeline_weekly": timed(weekly_pipeline, repeat),
+        "rolling_cold": timed(lambda: rolling.rolling_stats(email, df, view).stat("mean_30D", NAMES, start, end),
+                              repeat, setup=lambda: cache.health_data.invalidate(email, "rolling_stats")),
+        "rolling_warm": timed(lambda: rolling.rolling_stats(email, df, view).stat("mean_30D", NAMES, start, end), repeat),
+        "rolling_legacy": timed(legacy_rolling, repeat),
+        "table_page": timed(lambda: home.table_page(df_reshaped, 1, home.page_sizes[0]), repeat),
+        "table_legacy": timed(lambda: df_reshaped.sort_index(ascending=False).reset_index().astype(str), repeat),
+        "downsample": timed(lambda: downsample.downsample(df_chart), repeat),
+        "new_entry": timed(new_entry, repeat),
+        "login_cold": timed(login_cold, repeat),
+        "login_warm": timed(lambda: users.store.check(email, "password"), repeat),
+    }
+    return results, { "rows": len(df), "rows_in_range": len(df_chart) }
+
+def app_scenarios(email, repeat):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=120)
+    at.session_state["authenticated"] = True
+    at.session_state["email"] = email
+    def check(scenario):
+        # A failing script still renders (an error page), so its timings would look valid.
+        if at.exception: raise RuntimeError(f"{scenario}: {at.exception[0].message}")
+    results = { "app_first_run": timed(at.run, 1, setup=clear_caches) }
+    check("app_first_run")
+    results["app_rerun"] = timed(at.run, repeat)
+    check("app_rerun")
+    def all_time():
+        button = next((b for b in at.button if b.label == "All Time"), None)
+        if button is None: raise RuntimeError("app_all_time: no All Time button on the Home page")
+        button.click().run()
+    results["app_all_time"] = timed(all_time, repeat)
+    check("app_all_time")
+    return results
+
+def compare(results, baseline, threshold, min_ms=1.0):
+    # Sub-millisecond scenarios (cache hits) are too noisy to ratio, so they are skipped.
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None or max(base["median_ms"], result["median_ms"]) < min_ms: continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        if ratio > threshold: regressions.append((name, base["median_ms"], result["median_ms"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rerun pipeline on synthetic users.")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--backend", default="csv", choices=sorted(storage.backends))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-app", action="store_true", help="Skip the AppTest reruns")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.5, help="Allowed median slowdown vs the baseline")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Skip scenarios faster than this in both runs")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="health-bench-")
+    try:
+        emails, rows = generate(root, args.users, args.years, args.backend, args.seed)
+        os.chdir(root)
+        results, sizes = scenarios(emails[0], args.repeat)
+        if not args.no_app: results.update(app_scenarios(emails[-1], args.repeat))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        "config": { "users": args.users, "years": args.years, "backend": args.backend,
+                    "repeat": args.repeat, "seed": args.seed, "rows_total": rows, **sizes },
+        "environment": { "python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine() },
+        "scenarios": results,
+    }
+    text = json.dumps(output, indent=4)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+        regressions = compare(output, baseline, args.threshold, args.min_ms)
+        for name, base, now, ratio in regressions:
+            print(f"REGRESSION {name}: {base:.2f}ms -> {now:.2f}ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Process-wide LRU cache for parsed data files and the views derived from them. Entries
+# are keyed on (user, name) and validated against the (mtime, size) signature of the
+# files they were loaded from, so a changed file is reloaded even if nobody called
+# invalidate(). The LRU bound is on users, not entries: a user's frame and derived views
+# (wide view, index, rolling stats, rollups) are kept or evicted together, so one user
+# viewing every resolution cannot push other users' views out. Cached values are shared
+# between sessions and must be treated as read-only.
+class FileCache:
+    def __init__(self, max_users=32):
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._users = OrderedDict()  # user -> { name: (signature, value) }, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, user, name, paths, loader):
+        sig = signature(paths)
+        with self._lock:
+            entry = self._users.get(user, {}).get(name)
+            if entry is not None and entry[0] == sig:
+                self._users.move_to_end(user)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._users.setdefault(user, {})[name] = (sig, value)
+            self._users.move_to_end(user)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)  # Evict the least recently used user
+        return value
+
+    def peek(self, user, name):
+        # Return the cached value even if its files have changed, for incremental refresh.
+        with self._lock:
+            entry = self._users.get(user, {}).get(name)
+            return entry[1] if entry is not None else None
+
+    def invalidate(self, user, name=None):
+        with self._lock:
+            if name is None: self._users.pop(user, None)
+            elif user in self._users: self._users[user].pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return { "hits": self.hits, "misses": self.misses, "users": len(self._users), "max_users": self.max_users,
+                     "entries": sum(len(names) for names in self._users.values()) }
+
+def signature(paths):
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+health_data = FileCache(max_users=int(os.environ.get("HEALTH_CACHE_USERS", 32)))
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+# Server-side downsampling of chart series, so the Vega payload stays bounded however
+# long the selected history is. Each series is cut to a fixed number of points, the min
+# and max of equal buckets, so spikes survive.
+CHART_POINTS = 1000  # Points per series; Streamlit does not report the chart's pixel width
+
+def minmax(y, n):
+    # Sorted positions of the first and last point plus the minimum and maximum of each of
+    # n/2 equal buckets; preserves every spike.
+    size = len(y)
+    if n >= size or n < 4: return np.arange(size)
+    edges = np.linspace(0, size, n // 2 + 1).astype(int)
+    bucket = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+    order = np.lexsort((y, bucket))  # Sorted by value within each bucket
+    keep = np.concatenate([[0, size - 1], order[edges[:-1]], order[edges[1:] - 1]])
+    return np.unique(keep)
+
+def downsample(df, n=CHART_POINTS):
+    # df is a long chart frame (Date, Name, Value); each Name is downsampled separately.
+    df = df.dropna(subset=["Value"])
+    if df.empty: return df
+    parts = []
+    for _, series in df.groupby("Name", sort=False, observed=True):
+        if len(series) <= n:
+            parts.append(series)
+            continue
+        series = series.sort_values("Date")
+        parts.append(series.iloc[minmax(series["Value"].to_numpy(dtype="float64"), n)])
+    return pd.concat(parts, ignore_index=True)
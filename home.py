@@ -1,66 +1,80 @@
+import altair as alt
 import datetime as dt
+import downsample
+import numpy as np
 import pandas as pd
+import rolling
+import rollups
 import streamlit as st
+import timing
 
-def show_measurement_selection(df):
-    # Show selection of measurements to display.
-    df_pivot = df.pivot_table(index="Date", columns="Name", values="Value", aggfunc="mean")
+# Preset measurement buttons, in display order.
+measurement_presets = {
+    "Weight lbs": ["Weight", "Body Fat", "Subcutaneous Fat", "Visceral Fat",
+        "Muscle Mass", "Skeletal Muscle", "Bone Mass", "Protein", "Body Water"],
+    "Weight %": ["Body Fat %", "Subcutaneous Fat %", "Visceral Fat %",
+        "Muscle Mass %", "Skeletal Muscle %", "Bone Mass %", "Protein %", "Body Water %"],
+    "Weight Etc": ["Weight", "BMI", "Visceral Fat Index", "BMR", "Metabolic Age"],
+    "Lipid Panel": ["Cholesterol", "Triglycerides", "HDL", "LDL", "TC-HDL", "TC/HDL"],
+    "Keto": ["Glucose", "Ketone", "Dr. Boz Ratio"],
+    "Blood Pressure": ["Systolic", "Diastolic", "Pulse"],
+}
 
-    def select_measurements(measurements, rerun=True):
-        selected = []
-        for measurement in measurements:
-            if measurement in df_pivot.columns: selected += [measurement]
-        st.session_state["measure_selection"] = selected
-        if rerun: st.rerun()  # Rerun the app to reflect the change
+# Buttons update session state in on_click callbacks, which run before the next rerun,
+# so one click costs one script run instead of a run followed by st.rerun().
+def select_measurements(measurements, available):
+    st.session_state["measure_selection"] = [m for m in measurements if m in available]
 
+@timing.traced("home.measurement_selection")
+def show_measurement_selection(df, view):
+    # Show selection of measurements to display.
     if "measure_selection" not in st.session_state:
         # st.session_state["measure_selection"] = ["Cholesterol"]  # Default selected for demo purposes
-        select_measurements(["Weight", "Cholesterol", "Triglycerides", "HDL", "LDL", "Glucose"], rerun=False)
+        select_measurements(["Weight", "Cholesterol", "Triglycerides", "HDL", "LDL", "Glucose"], view.columns)
 
-    names = st.multiselect("Measurements", df.Name.unique(), st.session_state["measure_selection"])
+    names = st.multiselect("Measurements", df["Name"].cat.categories, st.session_state["measure_selection"])
     st.session_state["measure_selection"] = names  # Update session state with selected measurements
 
     # Add a row of buttons below measurement selection
-    btn_cols = st.columns([5,5,5,5,5,5])
-    with btn_cols[0]: btn0 = st.button("Weight lbs")
-    with btn_cols[1]: btn1 = st.button("Weight %")
-    with btn_cols[2]: btn2 = st.button("Weight Etc")
-    with btn_cols[3]: btn3 = st.button("Lipid Panel")
-    with btn_cols[4]: btn4 = st.button("Keto")
-    with btn_cols[5]: btn5 = st.button("Blood Pressure")
-
-    # Handle button clicks to update measurement selection
-    if btn0:
-        select_measurements(["Weight", "Body Fat", "Subcutaneous Fat", "Visceral Fat", 
-            "Muscle Mass", "Skeletal Muscle", "Bone Mass", "Protein", "Body Water"])
-    elif btn1:
-        select_measurements(["Body Fat %", "Subcutaneous Fat %", "Visceral Fat %", 
-            "Muscle Mass %", "Skeletal Muscle %", "Bone Mass %", "Protein %", "Body Water %"])
-    elif btn2:
-        select_measurements(["Weight", "BMI", "Visceral Fat Index", "BMR", "Metabolic Age"])
-    elif btn3:
-        select_measurements(["Cholesterol", "Triglycerides", "HDL", "LDL", "TC-HDL", "TC/HDL"])
-    elif btn4:
-        select_measurements(["Glucose", "Ketone", "Dr. Boz Ratio"])
-    elif btn5:
-        select_measurements(["Systolic", "Diastolic", "Pulse"])
+    btn_cols = st.columns(len(measurement_presets))
+    for col, (label, measurements) in zip(btn_cols, measurement_presets.items()):
+        with col: st.button(label, on_click=select_measurements, args=(measurements, view.columns))
 
     return names
 
-def select_start_date(start_date, rerun=True):
+# Trend overlays, mapped to the rolling statistic they show (see rolling.py).
+trends = {
+    "None": None,
+    "7D Moving Avg": "mean_7D",
+    "1M Moving Avg": "mean_30D",
+    "3M Moving Avg": "mean_90D",
+    "Exponential Avg": "ewma",
+    "1M Min/Max": "range_30D",
+}
+
+# Start date buttons, as offsets back from the latest reading (None is all time).
+date_presets = {
+    "All Time": None,
+    "2 Years": pd.DateOffset(years=2),
+    "1 Year": pd.DateOffset(years=1),
+    "6 Months": pd.DateOffset(months=6),
+    "3 Months": pd.DateOffset(months=3),
+    "1 Month": pd.DateOffset(months=1),
+}
+
+def select_start_date(start_date):
     st.session_state["start_date"] = start_date
-    if rerun: st.rerun()  # Rerun the app to reflect the change
 
-def show_date_selection(df):
-    if df.empty:
+@timing.traced("home.date_selection")
+def show_date_selection(view):
+    if view.sums.empty:
         max_date = pd.to_datetime(dt.date.today())
         min_date = max_date - pd.DateOffset(months=6)
     else:
-        max_date = df["Date"].max()
-        min_date = df["Date"].min()
+        min_date, max_date = view.sums.index[[0, -1]]  # The view is date-sorted, so the bounds are O(1)
     # Show start date and end date selection.
     if "start_date" not in st.session_state: 
-        select_start_date((max_date - pd.DateOffset(months=6)).date(), rerun=False)
+        select_start_date((max_date - pd.DateOffset(months=6)).date())
 
     #start_date = st.date_input("Start date", dt.date(2024,11,1))  # Default start date for demo purposes
     #start_date = st.date_input("Start date", df["Date"].min())
@@ -69,21 +83,151 @@ def show_date_selection(df):
     btn_cols = st.columns([5,5,1,5])
     with btn_cols[0]: start_date = st.date_input("Start date", st.session_state["start_date"])
     with btn_cols[1]: end_date = st.date_input("End date", max_date)
-    with btn_cols[3]: st.write(""); st.write(""); show_ma = st.checkbox("1M Moving Avg")
-    btn_cols = st.columns(6)
-    with btn_cols[0]: btn0 = st.button("All Time")
-    with btn_cols[1]: btn1 = st.button("2 Years")
-    with btn_cols[2]: btn2 = st.button("1 Year")
-    with btn_cols[3]: btn3 = st.button("6 Months")
-    with btn_cols[4]: btn4 = st.button("3 Months")
-    with btn_cols[5]: btn5 = st.button("1 Month")
-
-    # Handle button clicks to update start_date
-    if btn0: select_start_date(min_date.date())
-    elif btn1: select_start_date((max_date - pd.DateOffset(years=2)).date())
-    elif btn2: select_start_date((max_date - pd.DateOffset(years=1)).date())
-    elif btn3: select_start_date((max_date - pd.DateOffset(months=6)).date())
-    elif btn4: select_start_date((max_date - pd.DateOffset(months=3)).date())
-    elif btn5: select_start_date((max_date - pd.DateOffset(months=1)).date())
-
-    return start_date, end_date, show_ma
\ No newline at end of file
+    with btn_cols[3]: resolution = st.selectbox("Resolution", rollups.CHOICES, index=0, key="resolution",
+                                                help="Auto buckets long ranges into daily, weekly or monthly means.")
+    btn_cols = st.columns(len(date_presets))
+    for col, (label, offset) in zip(btn_cols, date_presets.items()):
+        preset = min_date if offset is None else max_date - offset
+        with col: st.button(label, on_click=select_start_date, args=(preset.date(),))
+
+    return start_date, end_date, resolution
+
+def long_frame(df_reshaped):
+    # pd.melt(df_reshaped.reset_index(), ...) without the reset_index copy or an object
+    # Name column: values are taken column by column, Name is a categorical over the
+    # columns, and the gaps (the leading NaNs ffill leaves) are dropped.
+    values = df_reshaped.to_numpy(dtype="float64")
+    dates = df_reshaped.index.to_numpy()
+    present = ~np.isnan(values)
+    return pd.DataFrame({
+        "Date": np.concatenate([dates[present[:, i]] for i in range(values.shape[1])] or [dates[:0]]),
+        "Name": pd.Categorical.from_codes(np.repeat(np.arange(values.shape[1], dtype="int32"), present.sum(axis=0)),
+                                          categories=df_reshaped.columns),
+        "Value": values.T[present.T],
+    }, copy=False)
+
+@st.fragment
+@timing.scoped("home.chart")
+def show_chart(email, df, view, df_reshaped, names, range_start, range_end, freq=None):
+    # A fragment: the trend and downsample widgets rerun only the chart, not the whole page.
+    cols = st.columns([5,5,1,5])
+    with cols[3]: trend = trends[st.selectbox("Trend", list(trends), index=0, key="trend")]
+    # Display the data as an Altair chart using `st.altair_chart`.
+    with timing.span("melt") as sp:
+        df_chart = long_frame(df_reshaped)
+        sp.rows = len(df_chart)
+    # Downsample each measurement to a fixed number of points before building the spec.
+    downsample_chart = st.toggle("Downsample chart", value=True, key="downsample_chart",
+                                 help=f"Keep the min/max of each bucket, about {downsample.CHART_POINTS} points per measurement.")
+    points_total = len(df_chart)
+    if downsample_chart:
+        with timing.span("downsample") as sp:
+            df_chart = downsample.downsample(df_chart)
+            sp.rows = len(df_chart)
+    chart = (
+        alt.Chart(df_chart)
+        .mark_line()
+        .encode(
+            x=alt.X("Date:T"), # axis=alt.Axis(format="%Y-%m-%d")
+            y=alt.Y("Value:Q"),
+            color=alt.Color("Name:N", legend=alt.Legend(title="Measurement", orient="bottom")),  # Legend at bottom
+        )
+        .properties(height=600)
+    )
+    # Overlay the selected rolling statistic, computed only when one is shown.
+    trend_points = trend_total = 0
+    if trend is not None:
+        with timing.span("rolling"):
+            stats = rolling.rolling_stats(email, df, view)
+        if trend.startswith("range_"):
+            window = trend.split("_", 1)[1]
+            with timing.span("rolling_stat") as sp:
+                df_trend = stats.stat(f"min_{window}", names, range_start, range_end).rename(columns={"Value": "Min"})
+                df_trend["Max"] = stats.stat(f"max_{window}", names, range_start, range_end)["Value"].to_numpy()
+                sp.rows = trend_total = len(df_trend)
+            trend_chart = (
+                alt.Chart(df_trend)
+                .mark_area(opacity=0.15)
+                .encode(
+                    x=alt.X("Date:T"),
+                    y=alt.Y("Min:Q"),
+                    y2=alt.Y2("Max:Q"),
+                    color=alt.Color("Name:N", legend=None),
+                )
+            )
+        else:
+            with timing.span("rolling_stat") as sp:
+                df_trend = stats.stat(trend, names, range_start, range_end)
+                trend_total = len(df_trend)
+                if downsample_chart: df_trend = downsample.downsample(df_trend)
+                sp.rows = len(df_trend)
+            trend_chart = (
+                alt.Chart(df_trend)
+                .mark_line(strokeDash=[5,5], opacity=0.7)
+                .encode(
+                    x=alt.X("Date:T"),
+                    y=alt.Y("Value:Q"),
+                    color=alt.Color("Name:N", legend=None),
+                )
+            )
+        trend_points = len(df_trend)
+        chart = chart + trend_chart
+    with timing.span("altair_chart") as sp:
+        st.altair_chart(chart, use_container_width=True)  # Serializes the spec and data
+        sp.rows = len(df_chart) + trend_points
+    # Readings and trend are counted separately, each as sent of in range.
+    caption = f"Chart points: {len(df_chart):,} of {points_total:,} readings in range"
+    if trend is not None: caption += f", {trend_points:,} of {trend_total:,} trend points"
+    st.caption(f"{caption} ({rollups.label(freq)})")
+
+# Table column order; precomputed as ranks so ordering is one sort, not nested scans.
+preset_order = [
+    "Date", "Weight", "BMI", 
+    "Body Fat", "Body Fat %", "Subcutaneous Fat", "Subcutaneous Fat %", "Visceral Fat", "Visceral Fat %", "Visceral Fat Index",
+    "Muscle Mass", "Muscle Mass %", "Skeletal Muscle", "Skeletal Muscle %", "Bone Mass", "Bone Mass %", 
+    "Protein", "Protein %", "Body Water", "Body Water %", "BMR", "Metabolic Age",
+    "Cholesterol", "Triglycerides", "HDL", "LDL", "TC-HDL", "TC/HDL", 
+    "Glucose", "Ketone", "Dr. Boz Ratio", 
+    "Systolic", "Diastolic", "Pulse",
+    "Uric Acid", "Haematocrit", "Haemoglobin",
+]
+preset_rank = {col: i for i, col in enumerate(preset_order)}
+page_sizes = [25, 50, 100, 250]
+
+def column_order(columns):
+    # Preset columns first in preset order, then any others in their existing order.
+    position = {col: i for i, col in enumerate(columns)}
+    return sorted(columns, key=lambda col: (preset_rank.get(col, len(preset_rank)), position[col]))
+
+def table_page(df_reshaped, page, page_size):
+    # df_reshaped is date-sorted ascending; the table shows newest first, one page at a time,
+    # so only the visible rows are reversed, formatted and sent.
+    hi = len(df_reshaped) - (page - 1) * page_size
+    df_page = df_reshaped.iloc[max(0, hi - page_size):hi].iloc[::-1]
+    df_display = df_page.reset_index()
+    df_display["Date"] = df_page.index.strftime("%Y-%m-%d")
+    return df_display[column_order(df_display.columns)]
+
+@st.fragment
+@timing.scoped("home.table")
+def show_table(df_reshaped):
+    # A fragment: paging reruns only the table.
+    rows = len(df_reshaped)
+    page_size = st.session_state.get("table_page_size", page_sizes[0])
+    pages = max(1, -(-rows // page_size))
+    page = min(st.session_state.get("table_page", 1), pages)
+    st.session_state["table_page"] = page  # Clamp when the date range or page size shrinks
+    with timing.span("table_page") as sp:
+        df_page = table_page(df_reshaped, page, page_size)
+        sp.rows = len(df_page)
+    with timing.span("st.dataframe"):
+        st.dataframe(
+            df_page,
+            use_container_width=True,
+            hide_index=True,  # Hide the index column
+            column_config={col: st.column_config.NumberColumn(col, format="%.1f") for col in df_reshaped.columns},
+        )
+    cols = st.columns([2,2,6])
+    with cols[0]: st.number_input("Page", min_value=1, max_value=pages, key="table_page")
+    with cols[1]: st.selectbox("Rows per page", page_sizes, key="table_page_size")
+    with cols[2]: st.write(""); st.write(""); st.caption(f"{rows:,} rows, page {page} of {pages}")
@@ -0,0 +1,135 @@
+import argparse
+import json
+import re
+import time
+import numpy as np
+import pandas as pd
+import profiles
+import settings
+import storage
+
+# Bulk import of device exports. Files are streamed in chunks (CSV, JSON lines, or a JSON
+# array), each chunk is mapped to long-format rows, rows whose (Date, Name) already exist
+# are dropped using a hash index of the user's data, and each chunk is written with one
+# append. Two layouts are accepted:
+#   long    Date, Name, Value[, Units, Note] -- Units default from profiles.units
+#   device  Date plus one column per input of an entry type (by input name or label),
+#           with derived metrics computed for the whole chunk by profiles.evaluate
+LONG = "Long format"
+CHUNK_SIZE = 50000
+DATE_COLUMNS = ["date", "datetime", "timestamp", "time"]
+
+def _normalize(name):
+    return re.sub(r"[^0-9a-z%]+", "_", str(name).strip().lower()).strip("_")
+
+def _keys(dates, names):
+    # 64-bit hash of (Date, Name) per row.
+    frame = pd.DataFrame({ "Date": pd.to_datetime(dates).astype("datetime64[us]"), "Name": np.asarray(names, dtype=object) })
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+class DedupIndex:
+    # Existing keys and each imported chunk's keys are kept as pandas Indexes, which build
+    # their hash table once, so checking a chunk costs O(rows in chunk) per index.
+    def __init__(self, df):
+        self.indexes = [pd.Index(pd.unique(_keys(df["Date"], df["Name"])))]
+
+    def new_rows(self, rows):
+        keys = _keys(rows["Date"], rows["Name"])
+        mask = ~pd.Index(keys).duplicated()  # Duplicates within the chunk
+        for index in self.indexes:
+            mask &= index.get_indexer(keys) < 0
+        self.indexes.append(pd.Index(keys[mask]))
+        return rows[mask]
+
+def read_chunks(source, fmt="csv", chunk_size=CHUNK_SIZE):
+    if fmt == "csv":
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    elif fmt == "jsonl":
+        yield from pd.read_json(source, lines=True, chunksize=chunk_size)
+    elif fmt == "json":
+        # A JSON array cannot be streamed with the standard library; it is parsed once and
+        # then processed in chunks like the other formats.
+        if hasattr(source, "read"): records = json.load(source)
+        else:
+            with open(source) as f: records = json.load(f)
+        for i in range(0, len(records), chunk_size):
+            yield pd.DataFrame.from_records(records[i:i + chunk_size])
+    else:
+        raise ValueError(f"Unknown format {fmt}")
+
+def _date_column(chunk):
+    for col in chunk.columns:
+        if _normalize(col) in DATE_COLUMNS: return col
+    raise ValueError("No Date column found")
+
+def to_rows(chunk, entry_type=LONG, params=None):
+    # Map one chunk to long-format rows; unparseable dates or values are dropped.
+    date_col = _date_column(chunk)
+    # Naive dates are kept as they are; dates with an offset are converted to UTC, since
+    # stored dates are naive.
+    dates = pd.to_datetime(chunk[date_col], errors="coerce", format="mixed", utc=True).dt.tz_convert(None)
+    columns = { _normalize(c): c for c in chunk.columns }
+    notes = chunk[columns["note"]].fillna("").astype(str).to_numpy() if "note" in columns else ""
+    if entry_type == LONG:
+        for col in ["name", "value"]:
+            if col not in columns: raise ValueError(f"Long format needs a {col.title()} column")
+        names = chunk[columns["name"]].astype(str)
+        units = chunk[columns["units"]] if "units" in columns else pd.Series(np.nan, index=chunk.index)
+        rows = pd.DataFrame({
+            "Date": dates,
+            "Name": names,
+            "Value": pd.to_numeric(chunk[columns["value"]], errors="coerce"),
+            "Units": units.where(units.notna(), names.map(profiles.units)).fillna(""),
+            "Note": notes,
+        })
+        return rows.dropna(subset=["Date", "Value"])
+    profile = profiles.profiles[entry_type]
+    inputs = []
+    for name, label in zip(profile["inputs"], profile["labels"]):
+        col = columns.get(_normalize(name), columns.get(_normalize(label)))
+        if col is None: raise ValueError(f"{entry_type} import needs a column for {label} ({name})")
+        inputs.append(pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype="float64"))
+    values = np.column_stack(inputs)
+    valid = dates.notna().to_numpy() & ~np.isnan(values).any(axis=1)
+    if not valid.any(): return profiles.evaluate(entry_type, np.empty((0, len(inputs))), [])
+    notes = notes[valid] if not isinstance(notes, str) else notes
+    return profiles.evaluate(entry_type, values[valid], dates[valid].to_numpy(), notes, params)
+
+def import_file(email, source, entry_type=LONG, fmt="csv", chunk_size=CHUNK_SIZE, params=None, progress=None):
+    start = time.perf_counter()
+    index = DedupIndex(storage.load_health_data(email))
+    stats = { "read": 0, "rows": 0, "written": 0, "duplicates": 0, "chunks": 0 }
+    for chunk in read_chunks(source, fmt, chunk_size):
+        rows = to_rows(chunk, entry_type, params)
+        new = index.new_rows(rows)
+        if not new.empty: storage.append_entries(email, new)  # One write per chunk
+        stats["read"] += len(chunk)
+        stats["rows"] += len(rows)
+        stats["written"] += len(new)
+        stats["duplicates"] += len(rows) - len(new)
+        stats["chunks"] += 1
+        if progress is not None: progress(stats)
+    if stats["written"]: storage.compact(email)
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+def detect_format(filename):
+    if filename.endswith(".jsonl") or filename.endswith(".ndjson"): return "jsonl"
+    if filename.endswith(".json"): return "json"
+    return "csv"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import a device export into a user's health data.")
+    parser.add_argument("email", help="User to import into")
+    parser.add_argument("file", help="CSV, JSON lines (.jsonl) or JSON array (.json) export")
+    parser.add_argument("--type", default=LONG, choices=[LONG] + list(profiles.profiles), help="Entry type of the rows")
+    parser.add_argument("--format", choices=["csv", "jsonl", "json"], help="File format (default: from extension)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--height", type=float, help="Height in inches for BMI (default: from the user's settings)")
+    args = parser.parse_args()
+    params = { "height": args.height } if args.height else settings.formula_params(args.email)
+    stats = import_file(args.email, args.file, args.type, args.format or detect_format(args.file), args.chunk_size, params,
+                        progress=lambda s: print(f"  chunk {s['chunks']}: {s['read']:,} read, {s['written']:,} written", flush=True))
+    print(f"Imported {stats['written']:,} rows ({stats['duplicates']:,} duplicates skipped) from {stats['read']:,} records "
+          f"in {stats['seconds']:.2f}s, {stats['rows_per_sec']:,.0f} records/s")
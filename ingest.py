@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import base64
+import json
+from collections import deque
+import pandas as pd
+import profiles
+import settings
+import storage
+import users
+
+# Headless ingestion API for scripts and device bridges, alongside the Streamlit app:
+#   POST /readings   HTTP Basic auth (the app's email and password); JSON body with one
+#                    reading or a list of them: { "type": <entry type in profiles.py>,
+#                    "values": [numbers] or "space separated", "date": ISO string (default
+#                    now; with an offset, converted to UTC and stored without it),
+#                    "note": "" }. Replies 201 { "rows": n } once the rows are stored.
+#   GET /health      queue and batch counters
+# Readings are validated as in new_entry.show (profiles.parse_values, check_inputs) when
+# they arrive, and evaluated and appended through profiles.evaluate and
+# storage.append_entries by a per-user writer. Writes are coalesced (group commit): while
+# one batch is being written, further readings for that user queue up and go out as the
+# next batch, evaluated with one vectorized call per entry type and stored with one
+# append, so a burst costs a few segment writes instead of one per request. A request is
+# answered only after its batch is written, so a 201 means the rows are on disk.
+#   python ingest.py --port 8502
+MAX_BODY = 1 << 20  # Bytes per request
+MAX_BATCH = 5000  # Readings per coalesced append
+LINGER = 0.005  # Seconds a writer waits for more readings before each batch (0: only what already queued)
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def write_readings(email, readings):
+    # Blocking: evaluate (entry type, values, date, note) readings and append their rows.
+    params = settings.formula_params(email)
+    by_type = {}
+    for entry_type, values, date, note in readings: by_type.setdefault(entry_type, []).append((values, date, note))
+    frames = [profiles.evaluate(t, [r[0] for r in rs], [r[1] for r in rs], [r[2] for r in rs], params)
+              for t, rs in by_type.items()]
+    storage.append_entries(email, frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True))
+
+class Coalescer:
+    # Per-user queues of (readings, future), each drained by one writer task at a time.
+    def __init__(self, write=write_readings, max_batch=MAX_BATCH, linger=LINGER):
+        self.write = write
+        self.max_batch = max_batch
+        self.linger = linger
+        self.queues = {}
+        self.writers = {}
+        self.stats = { "requests": 0, "readings": 0, "batches": 0, "errors": 0 }
+
+    async def submit(self, email, readings):
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(email, deque()).append((readings, future))
+        self.stats["requests"] += 1
+        if email not in self.writers: self.writers[email] = asyncio.create_task(self._drain(email))
+        return await future
+
+    async def _drain(self, email):
+        queue = self.queues[email]
+        try:
+            while queue:
+                if self.linger: await asyncio.sleep(self.linger)
+                batch, readings = [], []
+                while queue and (not batch or len(readings) + len(queue[0][0]) <= self.max_batch):
+                    batch.append(queue.popleft())
+                    readings.extend(batch[-1][0])
+                try:
+                    # Blocking file I/O runs in a thread; other users' batches proceed meanwhile.
+                    await asyncio.to_thread(self.write, email, readings)
+                except Exception as e:
+                    if len(batch) == 1:
+                        self._fail(batch[0][1], e)
+                        continue
+                    # Retry request by request, so one bad request cannot fail the others.
+                    for request, future in batch:
+                        try:
+                            await asyncio.to_thread(self.write, email, request)
+                        except Exception as e:
+                            self._fail(future, e)
+                            continue
+                        self.stats["batches"] += 1
+                        self._done(future, request)
+                    continue
+                self.stats["batches"] += 1
+                for request, future in batch: self._done(future, request)
+        finally:
+            del self.writers[email]  # No await since the queue was seen empty, so nothing was missed
+            if not queue: del self.queues[email]
+
+    def _done(self, future, readings):
+        self.stats["readings"] += len(readings)
+        if not future.done(): future.set_result(None)
+
+    def _fail(self, future, e):
+        self.stats["errors"] += 1
+        if not future.done(): future.set_exception(e)
+
+    def snapshot(self):
+        return { **self.stats, "queued": sum(len(q) for q in self.queues.values()), "writers": len(self.writers) }
+
+def authenticate(headers):
+    # Returns the email for valid Basic credentials.
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "basic": raise HttpError(401, "Basic authentication required")
+    try:
+        email, _, password = base64.b64decode(token).decode().partition(":")
+    except ValueError:
+        raise HttpError(401, "Malformed credentials")
+    if not users.store.check(email, password): raise HttpError(401, "Invalid email or password")
+    return email
+
+def parse_date(date, default):
+    # Stored dates are naive, so offsets are converted (to UTC) here rather than failing
+    # later in the batch write, where they would fail every request coalesced with this one.
+    if date is None or date == "": return default
+    if not isinstance(date, str): raise ValueError("date must be an ISO string")
+    date = pd.Timestamp(date)
+    if pd.isna(date): raise ValueError("date is missing")
+    return date.tz_convert(None) if date.tz is not None else date
+
+def parse_readings(body):
+    # Validated (entry type, values, date, note) readings from a request body.
+    try:
+        readings = json.loads(body)
+    except ValueError:
+        raise HttpError(400, "Body must be JSON")
+    if isinstance(readings, dict): readings = [readings]
+    if not isinstance(readings, list) or not readings: raise HttpError(400, "Expected a reading or a list of readings")
+    now = pd.Timestamp.now().floor("s")
+    parsed = []
+    for i, reading in enumerate(readings):
+        if not isinstance(reading, dict): raise HttpError(400, f"Reading {i}: expected an object")
+        entry_type = reading.get("type")
+        if entry_type not in profiles.profiles: raise HttpError(400, f"Reading {i}: unknown type {entry_type!r}")
+        try:
+            values = profiles.parse_values(reading.get("values"))
+            profiles.check_inputs(entry_type, len(values))
+            date = parse_date(reading.get("date"), now)
+        except profiles.InputCountError as e:
+            raise HttpError(400, f"Reading {i}: {e}")
+        except (ValueError, TypeError):
+            raise HttpError(400, f"Reading {i}: invalid values or date")
+        parsed.append((entry_type, values, date, str(reading.get("note") or "")))
+    return parsed
+
+class Server:
+    def __init__(self, coalescer=None):
+        self.coalescer = coalescer or Coalescer()
+
+    async def route(self, method, path, headers, body):
+        if path == "/health" and method == "GET": return 200, { "status": "ok", **self.coalescer.snapshot() }
+        if path != "/readings": raise HttpError(404, "Not found")
+        if method != "POST": raise HttpError(405, "Use POST")
+        email = authenticate(headers)
+        readings = parse_readings(body)
+        await self.coalescer.submit(email, readings)
+        return 201, { "rows": sum(len(profiles.profiles[r[0]]["outputs"]) for r in readings) }
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1: Content-Length bodies, keep-alive unless the client closes.
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                close = headers.get("connection", "").lower() == "close"
+                try:
+                    try:
+                        method, path, _ = line.decode("latin-1").split(" ", 2)
+                        length = int(headers.get("content-length", 0))
+                    except ValueError:
+                        close = True  # Cannot tell where the next request starts
+                        raise HttpError(400, "Malformed request")
+                    if length > MAX_BODY:
+                        close = True
+                        raise HttpError(413, "Body too large")
+                    body = await reader.readexactly(length)
+                    status, payload = await self.route(method, path.split("?", 1)[0], headers, body)
+                except HttpError as e:
+                    status, payload = e.status, { "error": str(e) }
+                except Exception as e:
+                    status, payload = 500, { "error": f"{type(e).__name__}: {e}" }
+                data = json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                if close: head += "Connection: close\r\n"
+                writer.write(head.encode() + b"\r\n" + data)
+                await writer.drain()
+                if close: break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+REASONS = { 200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error" }
+
+async def serve(host, port, coalescer=None):
+    server = Server(coalescer)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Ingesting on http://{host}:{port}/readings", flush=True)
+    async with listener: await listener.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP ingestion API for health readings.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Readings per coalesced append (1: no coalescing)")
+    parser.add_argument("--linger-ms", type=float, default=LINGER * 1000, help="Wait for more readings before each batch")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, Coalescer(write_readings, args.max_batch, args.linger_ms / 1000)))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,53 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+# Write coordination for user data. Each lock is an in-process RLock (one per path, so all
+# sessions in this server share it) plus an advisory flock on the lock file, held while
+# the outermost holder is inside, so writers in other processes are serialized too.
+# Every writer of a user's files takes user_lock(email) around read-modify-write, and
+# replaces files with storage.atomic_write (temp file + rename).
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._depth == 0:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a")
+                if fcntl is not None: fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            if self._file is not None: self._file.close()
+            self._file = None
+            self._lock.release()
+            raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None: fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def file_lock(path):
+    with _locks_lock:
+        if path not in _locks: _locks[path] = FileLock(path)
+        return _locks[path]
+
+def user_lock(email):
+    return file_lock(f"data/{email}/.lock")
@@ -0,0 +1,38 @@
+import argparse
+import locks
+import os
+import storage
+
+# One-shot migration of users' health data between storage backends, e.g.
+#   python migrate.py --to parquet            # every user under data/
+#   python migrate.py --to sqlite hiangswee   # selected users
+# The source store is verified against the new one and then renamed to *.migrated. The
+# user's lock is held throughout, so no append can land in the source after it was read;
+# appends waiting on the lock are redirected to the new store (storage._migrated).
+def migrate(email, to):
+    with locks.user_lock(email):
+        source = storage.get_backend(email)
+        if source.name == to: return None
+        df = source.read()
+        target = storage.get_backend(email, to)
+        if target.exists():
+            raise RuntimeError(f"{email}: a {to} store already exists")
+        target.create()
+        target.replace(df)
+        if len(target.read()) != len(df):
+            raise RuntimeError(f"{email}: row count mismatch after migrating to {to}")
+        for path in source.files():
+            if os.path.exists(path): os.replace(path, f"{path}.migrated")
+    storage.cache.health_data.invalidate(email)
+    return len(df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate health data to another storage backend.")
+    parser.add_argument("--to", required=True, choices=sorted(storage.backends), help="Target backend")
+    parser.add_argument("emails", nargs="*", help="Users to migrate (default: all users under data/)")
+    args = parser.parse_args()
+    emails = args.emails or sorted(e for e in os.listdir("data") if os.path.isdir(f"data/{e}"))
+    for email in emails:
+        rows = migrate(email, args.to)
+        if rows is None: print(f"{email}: already {args.to}")
+        else: print(f"{email}: migrated {rows} rows to {args.to}")
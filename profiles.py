@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+# Device/entry profiles. Each profile lists the values the user enters (inputs, in entry
+# order) and the rows it produces (outputs): (Name, expression, Units). Expressions are
+# Python arithmetic over the input names and params (e.g. height), evaluated on numpy
+# arrays, so one reading and a batch of readings take the same vectorized path.
+# Adding a device means adding a profile here.
+DEFAULT_HEIGHT = 5*12+6  # Inches, used for BMI = weight in lbs x 703 / (height in inches)^2
+
+units = {
+    "Weight": "lbs",
+    "BMR": "kcal",
+    "Systolic": "mmHg",
+    "Diastolic": "mmHg",
+    "Pulse": "Beats/min",
+    "Glucose": "mg/dL",
+    "Ketone": "mmol/L",
+    "Cholesterol": "mg/dL",
+    "Triglycerides": "mg/dL",
+    "HDL": "mg/dL",
+    "LDL": "mg/dL",
+    "Uric Acid": "mg/dL",
+    "Haematocrit": "%",
+    "Haemoglobin": "g/dL",
+}
+
+# Derived rows shared by several profiles.
+bmi = ("BMI", "weight*703/height**2", "")
+dr_boz_ratio = ("Dr. Boz Ratio", "Glucose/Ketone", "")
+tc_hdl = [("TC-HDL", "Cholesterol-HDL", units["Cholesterol"]), ("TC/HDL", "Cholesterol/HDL", "")]
+
+def measurements(names, derived=()):
+    # Profile that stores each entered value under its own name, plus derived rows.
+    inputs = [name.replace(" ", "_") for name in names]
+    return { "inputs": inputs, "labels": names,
+             "outputs": [(name, inp, units.get(name, "")) for name, inp in zip(names, inputs)] + list(derived) }
+
+profiles = {
+    "Weight": {
+        "help": "Body weight in pounds",
+        "inputs": ["weight"], "labels": ["Weight"],
+        "outputs": [("Weight", "weight", units["Weight"]), bmi],
+    },
+    "Systolic Diastolic Pulse": {
+        "help": "Blood pressure mmgH and pulse in Beats/min",
+        **measurements(["Systolic", "Diastolic", "Pulse"]),
+    },
+    "Glucose Ketone": {
+        "help": "Blood glucose in mg/dL and ketone mmol/L",
+        **measurements(["Glucose", "Ketone"], [dr_boz_ratio]),
+    },
+    "Glucose": {
+        "help": "Blood glucose in mg/dL",
+        **measurements(["Glucose"]),
+    },
+    "Ketone": {
+        "help": "Blood ketone in mmol/L",
+        **measurements(["Ketone"]),
+    },
+    "Cholesterol Triglycerides HDL LDL": {
+        "help": "Lipid panel in mg/dL",
+        **measurements(["Cholesterol", "Triglycerides", "HDL", "LDL"], tc_hdl),
+    },
+    "Cholesterol": {
+        "help": "Total cholesterol in mg/dL",
+        **measurements(["Cholesterol"]),
+    },
+    "Uric Acid": {
+        "help": "Uric acid in mg/dL",
+        **measurements(["Uric Acid"]),
+    },
+    "GE Fit Plus LN": {
+        "help": "13-in-1 body composition (Weight, Body Fat, BMI, Skeletal Muscle, Muscle Mass, Protein, BMR, Fat-Free Body Weight, Subcutaneous Fat, Visceral Fat, Body Water, Bone Mass, Metabolic Age)",
+        "inputs": ["weight", "bdy_fat_pct", "bmi", "skl_msc_pct", "msc_mss", "prt_pct",
+                   "bmr", "ff_wgt", "sub_fat_pct", "vis_fat_idx", "bdy_wtr_pct", "bon_mss", "mtb_age"],
+        "labels": ["Weight", "Body Fat", "BMI", "Skeletal Muscle", "Muscle Mass", "Protein", "BMR",
+                   "Fat-Free Body Weight", "Subcutaneous Fat", "Visceral Fat", "Body Water", "Bone Mass", "Metabolic Age"],
+        # weight = body_fat + muscle_mass + bone_mass
+        "outputs": [
+            ("Weight", "weight", units["Weight"]),
+            bmi,
+            ("Body Fat", "weight*bdy_fat_pct/100", units["Weight"]),
+            ("Body Fat %", "bdy_fat_pct", "%"),
+            ("Subcutaneous Fat", "weight*sub_fat_pct/100", units["Weight"]),
+            ("Subcutaneous Fat %", "sub_fat_pct", "%"),
+            ("Visceral Fat", "weight*(bdy_fat_pct-sub_fat_pct)/100", units["Weight"]),
+            ("Visceral Fat %", "bdy_fat_pct-sub_fat_pct", "%"),
+            ("Visceral Fat Index", "vis_fat_idx", ""),
+            ("Muscle Mass", "msc_mss", units["Weight"]),
+            ("Muscle Mass %", "100*msc_mss/weight", "%"),
+            ("Skeletal Muscle", "weight*skl_msc_pct/100", units["Weight"]),
+            ("Skeletal Muscle %", "skl_msc_pct", "%"),
+            ("Bone Mass", "bon_mss", units["Weight"]),
+            ("Bone Mass %", "100*bon_mss/weight", "%"),
+            ("Protein", "weight*prt_pct/100", units["Weight"]),
+            ("Protein %", "prt_pct", "%"),
+            ("Body Water", "weight*bdy_wtr_pct/100", units["Weight"]),
+            ("Body Water %", "bdy_wtr_pct", "%"),
+            ("BMR", "bmr", units["BMR"]),
+            ("Metabolic Age", "mtb_age", "Year"),
+        ],
+    },
+    "GE CS10G Body Composition": {
+        "help": "17-in-1 body composition (Weight, Body Water, Protein, Fat Mass, Bone Mass, Skeletal Muscle, Visceral Fat, Obesity, Weight Control, Fat Mass Control, Muscle Control, Health Assessment, Muscle Mass, BMR, Fat-Free Body Weight, Subcutaneous Fat, Metabolic Age)",
+        "inputs": ["weight", "bdy_wtr_pct", "prt_pct", "fat_mss_pct", "bon_mss_pct", "skl_msc", "vis_fat_idx", "obesity_pct",
+                   "wgt_ctrl", "fat_mss_ctrl", "msc_ctrl", "health_ass", "msc_mss", "bmr", "ff_wgt", "sub_fat_pct", "mtb_age"],
+        "labels": ["Weight", "Body Water", "Protein", "Fat Mass", "Bone Mass", "Skeletal Muscle", "Visceral Fat", "Obesity",
+                   "Weight Control", "Fat Mass Control", "Muscle Control", "Health Assessment", "Muscle Mass", "BMR",
+                   "Fat-Free Body Weight", "Subcutaneous Fat", "Metabolic Age"],
+        "outputs": [
+            ("Weight", "weight", units["Weight"]),
+            bmi,
+            ("Body Fat", "weight*fat_mss_pct/100", units["Weight"]),
+            ("Body Fat %", "fat_mss_pct", "%"),
+            ("Subcutaneous Fat", "weight*sub_fat_pct/100", units["Weight"]),
+            ("Subcutaneous Fat %", "sub_fat_pct", "%"),
+            ("Visceral Fat", "weight*(fat_mss_pct-sub_fat_pct)/100", units["Weight"]),
+            ("Visceral Fat %", "fat_mss_pct-sub_fat_pct", "%"),
+            ("Visceral Fat Index", "vis_fat_idx", ""),
+            ("Muscle Mass", "msc_mss", units["Weight"]),
+            ("Muscle Mass %", "100*msc_mss/weight", "%"),
+            ("Skeletal Muscle", "skl_msc", units["Weight"]),
+            ("Skeletal Muscle %", "100*skl_msc/weight", "%"),
+            ("Bone Mass", "weight*bon_mss_pct/100", units["Weight"]),
+            ("Bone Mass %", "bon_mss_pct", "%"),
+            ("Protein", "weight*prt_pct/100", units["Weight"]),
+            ("Protein %", "prt_pct", "%"),
+            ("Body Water", "weight*bdy_wtr_pct/100", units["Weight"]),
+            ("Body Water %", "bdy_wtr_pct", "%"),
+            ("BMR", "bmr", units["BMR"]),
+            ("Metabolic Age", "mtb_age", "Year"),
+            ("Obesity %", "obesity_pct", "%"),
+            ("Weight Control", "wgt_ctrl", "lbs"),
+            ("Fat Mass Control", "fat_mss_ctrl", "lbs"),
+            ("Muscle Control", "msc_ctrl", "lbs"),
+            ("Health Assessment", "health_ass", "Points"),
+        ],
+    },
+    "GE CS10G": {
+        "help": "9-in-1 body composition (Weight, Body Fat, BMI, Muscle Mass, BMR, Fat-Free Body Weight, Visceral Fat, Body Water, Bone Mass)",
+        "inputs": ["weight", "bdy_fat_pct", "bmi", "msc_mss", "bmr", "ff_wgt", "vis_fat_idx", "bdy_wtr_pct", "bon_mss"],
+        "labels": ["Weight", "Body Fat", "BMI", "Muscle Mass", "BMR", "Fat-Free Body Weight", "Visceral Fat", "Body Water", "Bone Mass"],
+        "outputs": [
+            ("Weight", "weight", units["Weight"]),
+            bmi,
+            ("Body Fat", "weight*bdy_fat_pct/100", units["Weight"]),
+            ("Body Fat %", "bdy_fat_pct", "%"),
+            ("Visceral Fat Index", "vis_fat_idx", ""),
+            ("Muscle Mass", "msc_mss", units["Weight"]),
+            ("Muscle Mass %", "100*msc_mss/weight", "%"),
+            ("Bone Mass", "bon_mss", units["Weight"]),
+            ("Bone Mass %", "100*bon_mss/weight", "%"),
+            ("Body Water", "weight*bdy_wtr_pct/100", units["Weight"]),
+            ("Body Water %", "bdy_wtr_pct", "%"),
+            ("BMR", "bmr", units["BMR"]),
+        ],
+    },
+    "Fora 6 BG HT HB": {
+        "help": "Glucose in mg/dL, Haematocrit in %, and Haemoglobin in g/dL",
+        **measurements(["Glucose", "Haematocrit", "Haemoglobin"]),
+    },
+}
+
+class InputCountError(ValueError):
+    pass
+
+_compiled = {}
+
+def _compile(expr):
+    if expr not in _compiled: _compiled[expr] = compile(expr, expr, "eval")
+    return _compiled[expr]
+
+def parse_values(values):
+    # One reading as entered: a space-separated string (the New Entry form) or a list of
+    # numbers (the ingestion API). Raises ValueError on anything that is not a number.
+    if isinstance(values, str): values = values.split(" ")
+    if isinstance(values, (int, float)): values = [values]
+    return [float(v) for v in values]
+
+def check_inputs(entry_type, count):
+    profile = profiles[entry_type]
+    if count != len(profile["inputs"]):
+        labels = profile["labels"]
+        listed = labels[0] if len(labels) == 1 else f"{', '.join(labels[:-1])} and {labels[-1]}"
+        raise InputCountError(f"Please enter all {len(profile['inputs'])} values for {listed}.")
+
+def evaluate(entry_type, values, dates, notes="", params=None):
+    # values is one reading (a list of inputs) or a 2D array of readings; dates and notes
+    # are scalars or one per reading. Returns long-format rows, reading by reading in
+    # profile output order.
+    profile = profiles[entry_type]
+    inputs = profile["inputs"]
+    values = np.asarray(values, dtype="float64")
+    if values.ndim == 1: values = values.reshape(1, -1)
+    check_inputs(entry_type, values.shape[1])
+    n = len(values)
+    env = { "height": DEFAULT_HEIGHT, **(params or {}) }
+    env.update({ name: values[:, i] for i, name in enumerate(inputs) })
+    outputs = profile["outputs"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns = [np.broadcast_to(eval(_compile(expr), {"__builtins__": {}}, env), n) for _, expr, _ in outputs]
+    k = len(outputs)
+    return pd.DataFrame({
+        "Date": np.repeat(pd.to_datetime(np.broadcast_to(dates, n)), k),
+        "Name": np.tile([name for name, _, _ in outputs], n),
+        "Value": np.column_stack(columns).ravel(),
+        "Units": np.tile([unit for _, _, unit in outputs], n),
+        "Note": np.repeat(np.broadcast_to(np.asarray(notes, dtype=object), n), k),
+    })
@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import json
+import locks
+import os
+import time
+import numpy as np
+import pandas as pd
+import profiles
+import settings
+import storage
+
+# Recomputation of derived rows (BMI, Body Fat, Visceral Fat, TC-HDL, TC/HDL, Dr. Boz
+# Ratio, ...) from the stored rows they were derived from, for when the user's settings
+# (height) change or a formula in profiles.py is corrected. A derived metric is a profile
+# output that no profile stores as an entered value; its formula is rewritten in terms of
+# stored measurement names and evaluated for every row of that metric at once. A derived
+# row is paired only with source rows of the same entry (the run of consecutive rows
+# with its Date, as profiles.evaluate writes them), and only when its Date has a single
+# reading of each source; other rows (hand-entered, or ambiguous) keep their stored
+# value. The history is rewritten atomically under the user's lock.
+# Each formula has its own fingerprint (expression plus the parameters it uses) in
+# settings.json, so a height change recomputes BMI only; bump VERSION to force a rerun
+# of every formula after a fix that does not change an expression.
+#   python recompute.py [--all] [--dry-run] [emails]
+VERSION = 1
+TOLERANCE = 1e-9  # Relative change below which a value counts as unchanged (CSV round-off)
+
+def derived_formulas():
+    # Name -> (expression, compiled expression, { input name: stored measurement name }).
+    entered = { name for p in profiles.profiles.values() for name, expr, _ in p["outputs"] if expr in p["inputs"] }
+    formulas = {}
+    for profile in profiles.profiles.values():
+        sources = { expr: name for name, expr, _ in profile["outputs"] if expr in profile["inputs"] }
+        for name, expr, _ in profile["outputs"]:
+            if name in entered or name in formulas: continue
+            code = compile(expr, expr, "eval")
+            used = [v for v in code.co_names if v in profile["inputs"]]
+            if all(v in sources for v in used): formulas[name] = (expr, code, { v: sources[v] for v in used })
+    return formulas
+
+formulas = derived_formulas()
+
+def fingerprints(params):
+    # Name -> fingerprint of its expression and the parameter values it uses.
+    params = { "height": float(profiles.DEFAULT_HEIGHT), **(params or {}) }  # As formula_params returns it
+    result = {}
+    for name, (expr, code, sources) in formulas.items():
+        used = { v: params[v] for v in code.co_names if v in params and v not in sources }
+        spec = json.dumps({ "version": VERSION, "expr": expr, "params": used }, sort_keys=True)
+        result[name] = hashlib.sha1(spec.encode()).hexdigest()[:12]
+    return result
+
+def recompute_frame(df, params=None, names=None):
+    # Returns (new frame, number of derived rows, number of changed rows); df is not modified.
+    # names limits the derived metrics recomputed (default: all).
+    names_col = df["Name"].to_numpy(dtype=object)
+    dates = df["Date"].to_numpy(dtype="datetime64[us]")
+    old = df["Value"].to_numpy(dtype="float64", na_value=np.nan)
+    values = old.copy()
+    entries = np.cumsum(np.r_[False, dates[1:] != dates[:-1]])[:len(dates)]  # Runs of consecutive rows with one Date
+    selected = { n: f for n, f in formulas.items() if names is None or n in names }
+    needed = { src for _, _, sources in selected.values() for src in sources.values() }
+    sources = pd.DataFrame({ "Entry": entries, "Date": dates, "Name": names_col, "Value": old })[np.isin(names_col, list(needed))]
+    unique = sources.groupby(["Date", "Name"])["Value"].transform("size") == 1  # One reading per Date and source
+    wide = sources[unique].pivot(index="Entry", columns="Name", values="Value")
+    derived = 0
+    env = { "height": profiles.DEFAULT_HEIGHT, **(params or {}) }
+    for name, (_, code, formula_sources) in selected.items():
+        rows = np.flatnonzero(names_col == name)
+        if not len(rows): continue
+        derived += len(rows)
+        at = wide.index.get_indexer(entries[rows])  # -1 (no paired source in the entry) picks the NaN pad
+        for var, src in formula_sources.items():
+            column = wide[src].to_numpy() if src in wide.columns else np.full(len(wide), np.nan)
+            env[var] = np.append(column, np.nan)[at]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            new = np.broadcast_to(eval(code, { "__builtins__": {} }, env), len(rows))
+        ok = np.isfinite(new)
+        values[rows[ok]] = new[ok]
+    changed = ~np.isclose(values, old, rtol=TOLERANCE, atol=0, equal_nan=True)
+    values = np.where(changed, values, old)  # Leave round-off differences as stored
+    return df.assign(Value=values), derived, int(changed.sum())
+
+def recompute(email, params=None, names=None, dry_run=False):
+    # Recompute and, if anything changed, rewrite the user's history; returns stats.
+    if params is None: params = settings.formula_params(email)
+    start = time.perf_counter()
+    with locks.user_lock(email):  # No append can land between the read and the rewrite
+        df = storage.get_backend(email).read()
+        new, derived, changed = recompute_frame(df, params, names)
+        if changed and not dry_run: storage.replace_health_data(email, new)
+    seconds = time.perf_counter() - start
+    return { "rows": len(df), "derived": derived, "changed": changed, "seconds": seconds,
+             "rows_per_sec": len(df) / seconds if seconds else 0.0 }
+
+def ensure_current(email):
+    # Recompute the formulas whose fingerprint differs from the recorded one. Rows written
+    # before fingerprints were kept used the default parameters (height 66 in), so with
+    # none recorded the defaults are compared against. Returns stats, or None when nothing
+    # needed recomputing.
+    saved = settings.load_settings(email)
+    params = settings.formula_params(email)
+    current = fingerprints(params)
+    previous = saved.get("derived_fingerprints") or fingerprints({})
+    stale = { name for name, fp in current.items() if previous.get(name) != fp }
+    stats = recompute(email, params, stale) if stale else None
+    # Users without settings follow the defaults; their settings file is not created here.
+    if "height" in saved and saved.get("derived_fingerprints") != current:
+        settings.save_settings(email, { "derived_fingerprints": current })
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute derived metrics from stored readings.")
+    parser.add_argument("emails", nargs="*", help="Users to recompute (default: all users under data/)")
+    parser.add_argument("--all", action="store_true", help="Recompute every formula, not only those whose fingerprint changed")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without rewriting (implies --all)")
+    args = parser.parse_args()
+    emails = args.emails or sorted(e for e in os.listdir("data") if os.path.isdir(f"data/{e}"))
+    for email in emails:
+        if args.all or args.dry_run:
+            params = settings.formula_params(email)
+            stats = recompute(email, params, dry_run=args.dry_run)
+            if not args.dry_run and "height" in settings.load_settings(email):
+                settings.save_settings(email, { "derived_fingerprints": fingerprints(params) })
+        else:
+            stats = ensure_current(email)
+        if stats is None: print(f"{email}: up to date")
+        else: print(f"{email}: {stats['changed']:,} of {stats['derived']:,} derived rows changed, {stats['rows']:,} rows "
+                    f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/s)")
@@ -0,0 +1,140 @@
+import cache
+import numpy as np
+import pandas as pd
+import storage
+import views
+
+# Rolling statistics over each measurement's readings (the wide view's Date x Name
+# means), computed for every measurement at once:
+#   mean_<w>, std_<w>, min_<w>, max_<w> for each window w in WINDOWS, over (t - w, t]
+#   ewma, the time-weighted exponential average with half-life EWMA_HALFLIFE
+# Means and stds come from cumulative sums and one searchsorted per window, min/max from
+# pandas' grouped rolling. Results are cached per user and, when rows are appended after
+# each measurement's last reading, extended from the tail instead of recomputed.
+WINDOWS = ["7D", "30D", "90D"]
+EWMA_HALFLIFE = "30D"
+
+class RollingStats:
+    def __init__(self, blocks, state, rows, checksum):
+        self.blocks = blocks  # Name -> frame of Date + stat columns, sorted by Date
+        self.state = state  # Name -> (last date, ewma numerator, ewma denominator)
+        self.rows = rows
+        self.checksum = checksum
+
+    def stat(self, stat, names=None, start=None, end=None):
+        # Long frame (Date, Name, Value) of one statistic, e.g. "mean_30D" or "ewma".
+        parts = []
+        for name in (names if names is not None else self.blocks):
+            if name not in self.blocks: continue
+            block = self.blocks[name]
+            dates = block["Date"].to_numpy()
+            lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start), "us"))
+            hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end), "us"), side="right")
+            parts.append(pd.DataFrame({ "Date": dates[lo:hi], "Name": name, "Value": block[stat].to_numpy()[lo:hi] }))
+        if not parts: return pd.DataFrame({ "Date": pd.Series(dtype="datetime64[us]"), "Name": pd.Series(dtype=object), "Value": pd.Series(dtype=float) })
+        return pd.concat(parts, ignore_index=True)
+
+def _long(view, names=None):
+    columns = view.columns if names is None else [c for c in view.columns if c in set(names)]
+    wide = view.sums[columns] / view.counts[columns].where(view.counts[columns] > 0)
+    wide.index.name = "Date"
+    wide.columns.name = "Name"
+    long = wide.reset_index().melt(id_vars="Date", var_name="Name", value_name="Value").dropna(subset=["Value"])
+    long["Date"] = long["Date"].astype("datetime64[us]")
+    return long.sort_values(["Name", "Date"], kind="stable").reset_index(drop=True)
+
+def _windowed(long):
+    # long is sorted by (Name, Date). Rows are keyed as name_code * 1e10 + seconds so one
+    # searchsorted finds every row's window start without crossing into another name.
+    codes = pd.Categorical(long["Name"]).codes.astype("int64")
+    secs = long["Date"].to_numpy(dtype="datetime64[s]").astype("int64")
+    if len(secs): secs = secs - secs.min()
+    key = codes * 10**10 + secs
+    # Cumulative sums restart at each name, over values shifted by the name's mean, so a
+    # window's sum of squares is not the difference of two running totals far larger than
+    # it (BMR squared, summed over years, would swamp a Ketone window).
+    shift = long.groupby("Name", sort=False)["Value"].transform("mean").to_numpy(dtype="float64")
+    d = long["Value"].to_numpy(dtype="float64") - shift
+    cs = pd.Series(d).groupby(codes, sort=False).cumsum().to_numpy()
+    cs2 = pd.Series(d * d).groupby(codes, sort=False).cumsum().to_numpy()
+    idx = np.arange(len(d))
+    out = {}
+    grouped = long.groupby("Name", sort=False)
+    for w in WINDOWS:
+        start = np.searchsorted(key, key - int(pd.Timedelta(w).total_seconds()), side="right")
+        n = idx + 1 - start
+        s = cs[idx] - cs[start] + d[start]  # Same name, so the sums over [start, idx]
+        s2 = cs2[idx] - cs2[start] + d[start] * d[start]
+        out[f"mean_{w}"] = s / n + shift
+        rolled = grouped.rolling(w, on="Date")["Value"]
+        out[f"min_{w}"] = rolled.min().to_numpy()  # Groups come out in long's (Name, Date) order
+        out[f"max_{w}"] = rolled.max().to_numpy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(np.maximum(s2 - s * s / n, 0) / (n - 1))
+        out[f"std_{w}"] = np.where(n > 1, np.where(out[f"min_{w}"] == out[f"max_{w}"], 0.0, std), np.nan)  # Constant windows exactly 0
+    return out
+
+def _ewma(long):
+    # Weighted sums with weights 2^((t_i - t_first) / halflife) per name, so the average at
+    # t is cumsum(w*x) / cumsum(w). Fine for histories up to ~1000 half-lives (80 years).
+    h = pd.Timedelta(EWMA_HALFLIFE).total_seconds()
+    secs = long["Date"].to_numpy(dtype="datetime64[s]").astype("int64")
+    first = long.groupby("Name", sort=False)["Date"].transform("min").to_numpy(dtype="datetime64[s]").astype("int64")
+    t = (secs - first) / h
+    w = np.exp2(t)
+    v = long["Value"].to_numpy(dtype="float64")
+    names = long["Name"].to_numpy()
+    num = pd.Series(w * v).groupby(names, sort=False).cumsum().to_numpy()
+    den = pd.Series(w).groupby(names, sort=False).cumsum().to_numpy()
+    scale = np.exp2(-t)
+    return num / den, num * scale, den * scale
+
+def _build(long):
+    stats = _windowed(long)
+    stats["ewma"], num, den = _ewma(long)
+    frame = pd.DataFrame({ "Date": long["Date"].to_numpy(), "Name": long["Name"].to_numpy(), **stats })
+    blocks, state = {}, {}
+    for name, block in frame.groupby("Name", sort=False):
+        blocks[name] = block.drop(columns="Name").reset_index(drop=True)
+        last = block.index[-1]
+        state[name] = (block["Date"].iloc[-1], num[last], den[last])
+    return blocks, state
+
+def _extend(prev, view, new_rows):
+    # New readings must all be later than their measurement's last computed date;
+    # otherwise averages of existing cells change and the caller rebuilds.
+    blocks, state = dict(prev.blocks), dict(prev.state)
+    h = pd.Timedelta(EWMA_HALFLIFE).total_seconds()
+    span = max(pd.Timedelta(w) for w in WINDOWS)
+    for name, rows in new_rows.groupby("Name", sort=False, observed=True):
+        first_new = rows["Date"].min()
+        if name in state and first_new <= state[name][0]: return None
+        long = _long(view, [name])
+        tail = long[long["Date"] > first_new - span].reset_index(drop=True)
+        stats = _windowed(tail)
+        new = tail["Date"] >= first_new
+        block = pd.DataFrame({ "Date": tail["Date"][new].to_numpy(), **{ k: v[new.to_numpy()] for k, v in stats.items() } })
+        last_date, num, den = state.get(name, (None, 0.0, 0.0))
+        ewma = []
+        for date, value in zip(block["Date"], tail["Value"][new]):
+            decay = 0.0 if last_date is None else 0.5 ** ((date - last_date).total_seconds() / h)
+            num, den, last_date = num * decay + value, den * decay + 1.0, date
+            ewma.append(num / den)
+        block["ewma"] = ewma
+        blocks[name] = pd.concat([prev.blocks[name], block], ignore_index=True) if name in prev.blocks else block
+        state[name] = (last_date, num, den)
+    return blocks, state
+
+def rolling_stats(email, df=None, view=None):
+    # Only call this when a rolling statistic is actually displayed.
+    if df is None: df = storage.load_health_data(email)
+    if view is None: view = views.wide_view(email, df)
+    def load():
+        prev = cache.health_data.peek(email, "rolling_stats")
+        result = None
+        if prev is not None and prev.rows <= view.rows and prev.checksum == views.checksum(df, prev.rows):
+            if prev.rows == view.rows: return prev
+            result = _extend(prev, view, df.iloc[prev.rows:view.rows])
+        if result is None: result = _build(_long(view))
+        return RollingStats(*result, view.rows, view.checksum)
+    return cache.health_data.get(email, "rolling_stats", storage.get_backend(email).files(), load)
@@ -0,0 +1,86 @@
+import cache
+import pandas as pd
+import storage
+import views
+
+# Pre-aggregated rollups of a user's readings per measurement into daily, weekly
+# (Monday-start) or monthly buckets. A rollup keeps one Bucket x (stat, Name) frame of
+# sum, count, min and max; means are sum / count. Like the wide view, appended rows
+# are folded in from the tail (regrouping only the buckets they land in), so a
+# multi-year range reads a few hundred bucket rows instead of re-pivoting raw readings.
+RESOLUTIONS = { "Daily": "D", "Weekly": "W", "Monthly": "M" }
+CHOICES = ["Auto", "Raw"] + list(RESOLUTIONS)
+STATS = { "sum": "sum", "count": "sum", "min": "min", "max": "max" }  # Stat -> how buckets combine
+MAX_BUCKETS = 400  # Auto picks the finest resolution with at most this many buckets
+RAW_SPAN = pd.Timedelta(days=366)  # Auto shows raw readings for ranges up to a year
+BUCKET_LENGTH = { "D": pd.Timedelta(days=1), "W": pd.Timedelta(weeks=1), "M": pd.Timedelta(days=30.44) }
+
+def resolve(resolution, start, end):
+    # Frequency to aggregate to for a selector choice and range, or None for raw readings.
+    if resolution == "Raw": return None
+    if resolution != "Auto": return RESOLUTIONS[resolution]
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    if span <= RAW_SPAN: return None
+    for freq in RESOLUTIONS.values():
+        if span / BUCKET_LENGTH[freq] <= MAX_BUCKETS: return freq
+    return "M"
+
+def label(freq):
+    return "raw readings" if freq is None else next(k for k, v in RESOLUTIONS.items() if v == freq).lower() + " means"
+
+def buckets(dates, freq):
+    # Start of each date's bucket.
+    return pd.Series(dates).dt.to_period(freq).dt.start_time.astype("datetime64[us]").to_numpy()
+
+class Rollup:
+    def __init__(self, freq, table=None, rows=0, checksum=0):
+        self.freq = freq
+        self.table = table  # Bucket x (stat, Name) frame, None until rows are folded in
+        self.rows = rows
+        self.checksum = checksum
+
+    def extend(self, df):
+        # Fold in raw rows [self.rows:] and return a new rollup; self is shared, so never mutated.
+        new = df.iloc[self.rows:]
+        if new.empty: return self
+        values = pd.Series(new["Value"].to_numpy(), index=[buckets(new["Date"], self.freq), new["Name"]])
+        added = values.groupby(level=[0, 1], observed=True).agg(list(STATS)).unstack(1)  # (stat, Name) columns
+        added.columns = added.columns.set_levels(added.columns.levels[1].astype(object), level=1)
+        old = self.table
+        if old is not None:
+            # Only buckets from the first new one on are regrouped; earlier ones are kept.
+            split = old.index.searchsorted(added.index.min())
+            tail = pd.concat([old.iloc[split:], added])
+            if split < len(old):
+                tail = pd.concat({ stat: tail[stat].groupby(level=0).agg(how) for stat, how in STATS.items() }, axis=1)
+            added = pd.concat([old.iloc[:split], tail])
+        table = added.sort_index(axis=1).rename_axis("Date").rename_axis(["Stat", "Name"], axis=1)
+        return Rollup(self.freq, table, len(df), views.checksum(df, len(df)))
+
+    def slice(self, start=None, end=None, columns=None, stat="mean"):
+        # Buckets overlapping [start, end) as a Date x Name frame of one stat, with empty
+        # rows and columns dropped as in WideView.slice.
+        table = self.table
+        if table is None: return pd.DataFrame(index=pd.DatetimeIndex([], name="Date"), columns=pd.Index([], name="Name"))
+        lo = 0 if start is None else table.index.searchsorted(buckets([pd.Timestamp(start)], self.freq)[0])
+        hi = len(table) if end is None else table.index.searchsorted(pd.Timestamp(end))
+        part = table.iloc[lo:hi]
+        if columns is None: columns = list(part["count"].columns)
+        else: columns = [c for c in part["count"].columns if c in set(columns)]
+        counts = part["count"][columns]
+        if stat == "mean": wide = part["sum"][columns] / counts.where(counts > 0)
+        else: wide = part[stat][columns].where(counts > 0)
+        wide = wide.dropna(axis=0, how="all").dropna(axis=1, how="all")
+        wide.columns.name = "Name"
+        return wide
+
+def rollup(email, freq, df=None):
+    # Built on first use per resolution, so only the resolutions actually viewed are kept.
+    if df is None: df = storage.load_health_data(email)
+    key = f"rollup_{freq}"
+    def load():
+        prev = cache.health_data.peek(email, key)
+        if prev is None or prev.rows > len(df) or prev.checksum != views.checksum(df, prev.rows):
+            prev = Rollup(freq)  # History was rewritten
+        return prev.extend(df)
+    return cache.health_data.get(email, key, storage.get_backend(email).files(), load)
@@ -1,16 +1,38 @@
 import datetime as dt
 import json
+import locks
 import pandas as pd
+import storage
 import streamlit as st
+import timing
 
-def load_settings():
+def settings_file(email):
+    return f"data/{email}/settings.json"
+
+def load_settings(email=None):
+    if email is None: email = st.session_state["email"]
     try:
-        with open(f"data/{st.session_state['email']}/settings.json", "r") as f:
+        with open(settings_file(email), "r") as f:
             settings = json.load(f)
         return settings
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
-    
+
+def formula_params(email):
+    # Parameters for profiles.evaluate and recompute; height (inches) is used for BMI.
+    settings = load_settings(email)
+    return { "height": float(settings["height"]) } if "height" in settings else {}
+
+def save_settings(email, updates):
+    # Re-read under the user's lock so a concurrent save from another session is merged,
+    # not overwritten, then replace the file atomically.
+    with locks.user_lock(email):
+        settings = load_settings(email)
+        settings.update(updates)
+        storage.atomic_write(settings_file(email), lambda f: json.dump(settings, f, indent=4))
+    return settings
+
+@timing.traced("settings.show")
 def show():
     settings = load_settings()
 
@@ -26,9 +48,7 @@ def show():
 
     if submitted:
         try:
-            settings["height"] = float(height)
-            with open(f"data/{st.session_state['email']}/settings.json", "w") as f:
-                json.dump(settings, f, indent=4)
+            settings = save_settings(st.session_state["email"], {"height": float(height)})
             st.success("Settings saved!")
         except ValueError:
             st.error(f"Invalid {height}. Please enter valid number.")
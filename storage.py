@@ -0,0 +1,357 @@
+import argparse
+import cache
+import json
+import locks
+import os
+import sqlite3
+import threading
+import time
+import timing
+import uuid
+import pandas as pd
+
+# All reads and writes of a user's health data go through a storage backend:
+#   csv      data/<email>/health_data.csv + segments/<seq>.csv (the original layout)
+#   parquet  data/<email>/health_data.parquet + segments/<seq>.parquet, typed columns
+#   sqlite   data/<email>/health_data.sqlite, indexed on (Name, Date)
+# A user's backend is whichever store exists in their directory; new users get
+# HEALTH_STORAGE (default csv). Every backend returns the same frame: Name, Value,
+# Units, Date (datetime64), Note, in insertion order.
+COLUMNS = ["Name", "Value", "Units", "Date", "Note"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+COMPACT_SEGMENTS = int(os.environ.get("HEALTH_COMPACT_SEGMENTS", 32))  # Auto-compact threshold
+DEFAULT_BACKEND = os.environ.get("HEALTH_STORAGE", "csv")
+
+def user_dir(email):
+    return f"data/{email}"
+
+def atomic_write(path, write, mode="w"):
+    # Write to a temp file in the same directory, fsync, then rename over the target so
+    # readers see either the old or the new file, never a partial one.
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp, mode, **({"newline": ""} if mode == "w" else {})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def _filter(df, names=None, start=None, end=None):
+    if names is not None: df = df[df["Name"].isin(names)]
+    if start is not None: df = df[df["Date"] >= pd.Timestamp(start)]
+    if end is not None: df = df[df["Date"] < pd.Timestamp(end)]
+    return df
+
+# --- Append-only segmented file stores (CSV and Parquet) ---
+# New rows go to their own segment file, so an append is O(rows added). Loading reads
+# base + segments in order; compact() merges the segments back into the base.
+class SegmentedBackend:
+    name = None
+    ext = None
+
+    def __init__(self, email):
+        self.email = email
+        self.base_file = os.path.join(user_dir(email), f"health_data.{self.ext}")
+        self.segments_dir = os.path.join(user_dir(email), "segments")
+        self.journal_file = os.path.join(self.segments_dir, f"compaction.{self.ext}.json")
+
+    def exists(self):
+        return os.path.exists(self.base_file)
+
+    def segment_files(self):
+        try:
+            names = sorted(n for n in os.listdir(self.segments_dir) if n.endswith(f".{self.ext}"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.segments_dir, n) for n in names]
+
+    def files(self):
+        return [self.base_file] + self.segment_files()
+
+    def create(self):
+        os.makedirs(user_dir(self.email), exist_ok=True)
+        if not self.exists():
+            self.write_file(self.base_file, pd.DataFrame(columns=COLUMNS))
+
+    def read(self, names=None, start=None, end=None):
+        with locks.user_lock(self.email):
+            self._recover()
+            frames = [self.read_file(path, names, start, end) for path in self.files() if os.path.exists(path)]
+        frames = [f for f in frames if not f.empty]
+        if not frames: return _empty_frame()
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        return df.reset_index(drop=True)
+
+    def append(self, new_df):
+        os.makedirs(self.segments_dir, exist_ok=True)
+        seq = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        with locks.user_lock(self.email):
+            moved = _migrated(self)
+            if moved is not None: return moved.append(new_df)
+            self.write_file(os.path.join(self.segments_dir, f"{seq}.{self.ext}"), new_df)
+        if len(self.segment_files()) >= COMPACT_SEGMENTS:
+            threading.Thread(target=compact, args=(self.email,), daemon=True).start()
+
+    def replace(self, df):
+        # Atomically replace the whole history (used by migrations and recomputation).
+        with locks.user_lock(self.email):
+            self._recover()
+            segments = self.segment_files()
+            self._write_journal(segments)
+            self.write_file(self.base_file, df)
+            self._finish(segments)
+
+    def compact(self):
+        with locks.user_lock(self.email):
+            self._recover()
+            segments = self.segment_files()
+            if not segments: return 0
+            merged = self.read()
+            self._write_journal(segments)
+            self.write_file(self.base_file, merged)
+            self._finish(segments)
+        return len(segments)
+
+    # The journal records which segments are being merged and the old base's (inode, mtime),
+    # so an interrupted compaction can tell whether the base was already replaced. The size
+    # is not enough: a rewrite can produce a base of the same size, but atomic_write always
+    # renames a new file (a new inode) over it.
+    def _base_stamp(self):
+        if not self.exists(): return None
+        st = os.stat(self.base_file)
+        return [st.st_ino, st.st_mtime_ns]
+
+    def _write_journal(self, segments):
+        journal = { "segments": [os.path.basename(p) for p in segments], "base": self._base_stamp() }
+        os.makedirs(self.segments_dir, exist_ok=True)
+        atomic_write(self.journal_file, lambda f: json.dump(journal, f))
+
+    def _finish(self, segments):
+        for path in segments: os.remove(path)
+        os.remove(self.journal_file)
+
+    def _recover(self):
+        if not os.path.exists(self.journal_file): return
+        with open(self.journal_file) as f:
+            journal = json.load(f)
+        if "base" in journal: replaced = journal["base"] != self._base_stamp()
+        else: replaced = journal["base_size"] != (os.path.getsize(self.base_file) if self.exists() else None)  # Older journals
+        if replaced:
+            # The base was replaced before the crash, so its segments are already merged.
+            for name in journal["segments"]:
+                path = os.path.join(self.segments_dir, name)
+                if os.path.exists(path): os.remove(path)
+        os.remove(self.journal_file)
+
+class CsvBackend(SegmentedBackend):
+    name = "csv"
+    ext = "csv"
+
+    def read_file(self, path, names=None, start=None, end=None):
+        with timing.span("read_csv") as sp:
+            df = pd.read_csv(path)
+            sp.rows = len(df)
+        if df.empty: return _empty_frame()
+        with timing.span("to_datetime"):
+            df["Date"] = pd.to_datetime(df["Date"], format="ISO8601")  # Convert 'date' column to datetime
+        return _filter(df[COLUMNS], names, start, end)
+
+    def write_file(self, path, df):
+        # Keep the column order of an existing base file so rewrites stay diffable.
+        columns = COLUMNS
+        if path == self.base_file and self.exists():
+            header = pd.read_csv(path, nrows=0).columns
+            if set(header) == set(COLUMNS): columns = list(header)
+        df = df.reindex(columns=columns)
+        atomic_write(path, lambda f: df.to_csv(f, index=False, date_format=DATE_FORMAT))
+
+class ParquetBackend(SegmentedBackend):
+    name = "parquet"
+    ext = "parquet"
+
+    def schema(self):
+        import pyarrow as pa
+        return pa.schema([
+            ("Name", pa.dictionary(pa.int32(), pa.string())),
+            ("Value", pa.float64()),
+            ("Units", pa.dictionary(pa.int32(), pa.string())),
+            ("Date", pa.timestamp("us")),
+            ("Note", pa.string()),
+        ])
+
+    def read_file(self, path, names=None, start=None, end=None):
+        import pyarrow.parquet as pq
+        # Date and Name predicates are pushed down to the row-group statistics.
+        filters = []
+        if names is not None: filters.append(("Name", "in", list(names)))
+        if start is not None: filters.append(("Date", ">=", pd.Timestamp(start).to_pydatetime()))
+        if end is not None: filters.append(("Date", "<", pd.Timestamp(end).to_pydatetime()))
+        table = pq.read_table(path, filters=filters or None)
+        df = table.to_pandas()
+        df["Name"] = df["Name"].astype(object)
+        df["Units"] = df["Units"].astype(object)
+        df["Note"] = df["Note"].astype(object)
+        df["Date"] = df["Date"].astype("datetime64[us]")
+        return df[COLUMNS]
+
+    def write_file(self, path, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        df = df.reindex(columns=COLUMNS)
+        arrays = [
+            pa.array(df["Name"].astype(object), type=pa.string(), from_pandas=True).dictionary_encode(),
+            pa.array(pd.to_numeric(df["Value"]), type=pa.float64(), from_pandas=True),
+            pa.array(df["Units"].astype(object).where(df["Units"].notna(), None), type=pa.string()).dictionary_encode(),
+            pa.array(pd.to_datetime(df["Date"]).astype("datetime64[us]"), type=pa.timestamp("us"), from_pandas=True),
+            pa.array(df["Note"].astype(object).where(df["Note"].notna(), None), type=pa.string()),
+        ]
+        table = pa.Table.from_arrays(arrays, schema=self.schema())
+        atomic_write(path, lambda f: pq.write_table(table, f, row_group_size=64 * 1024), mode="wb")
+
+# --- SQLite store ---
+# Appends are plain INSERTs; Date is stored as epoch microseconds so loading needs no
+# text parsing, and the (Name, Date) index serves measurement/range queries.
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, email):
+        self.email = email
+        self.base_file = os.path.join(user_dir(email), "health_data.sqlite")
+
+    def exists(self):
+        return os.path.exists(self.base_file)
+
+    def files(self):
+        return [self.base_file, f"{self.base_file}-wal", f"{self.base_file}-shm"]
+
+    def connect(self):
+        con = sqlite3.connect(self.base_file, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS health_data (Name TEXT NOT NULL, Value REAL, Units TEXT, Date INTEGER NOT NULL, Note TEXT)")
+        con.execute("CREATE INDEX IF NOT EXISTS health_data_name_date ON health_data (Name, Date)")
+        return con
+
+    def create(self):
+        os.makedirs(user_dir(self.email), exist_ok=True)
+        self.connect().close()
+
+    def read(self, names=None, start=None, end=None):
+        where, params = [], []
+        if names is not None:
+            where.append(f"Name IN ({','.join('?' * len(names))})")
+            params += list(names)
+        if start is not None:
+            where.append("Date >= ?")
+            params.append(_to_micros(start))
+        if end is not None:
+            where.append("Date < ?")
+            params.append(_to_micros(end))
+        sql = "SELECT Name, Value, Units, Date, Note FROM health_data"
+        if where: sql += " WHERE " + " AND ".join(where)
+        with locks.user_lock(self.email):
+            con = self.connect()
+            try:
+                df = pd.read_sql_query(sql + " ORDER BY rowid", con, params=params)
+            finally:
+                con.close()
+        if df.empty: return _empty_frame()
+        df["Date"] = pd.to_datetime(df["Date"], unit="us")
+        return df
+
+    def _rows(self, df):
+        df = df.reindex(columns=COLUMNS)
+        dates = pd.to_datetime(df["Date"]).astype("datetime64[us]").astype("int64")
+        clean = lambda s: s.astype(object).where(s.notna(), None)
+        return list(zip(clean(df["Name"]), clean(pd.to_numeric(df["Value"])), clean(df["Units"]), dates.tolist(), clean(df["Note"])))
+
+    def append(self, new_df):
+        with locks.user_lock(self.email):
+            moved = _migrated(self)
+            if moved is not None: return moved.append(new_df)
+            con = self.connect()
+            try:
+                with con:
+                    con.executemany("INSERT INTO health_data VALUES (?, ?, ?, ?, ?)", self._rows(new_df))
+            finally:
+                con.close()
+
+    def replace(self, df):
+        with locks.user_lock(self.email):
+            con = self.connect()
+            try:
+                with con:  # One transaction, so readers see the old or the new history
+                    con.execute("DELETE FROM health_data")
+                    con.executemany("INSERT INTO health_data VALUES (?, ?, ?, ?, ?)", self._rows(df))
+            finally:
+                con.close()
+
+    def compact(self):
+        return 0  # Nothing to merge; appends already land in the table
+
+def _migrated(backend):
+    # The user's current backend if backend's store was migrated away (migrate.py) while
+    # the caller waited for the lock, so the append goes to the new store, not a renamed one.
+    if backend.exists(): return None
+    current = get_backend(backend.email)
+    return current if current.name != backend.name else None
+
+def _to_micros(ts):
+    return int(pd.Timestamp(ts).value // 1000)
+
+def _empty_frame():
+    df = pd.DataFrame({ "Name": pd.Series(dtype=object), "Value": pd.Series(dtype=float),
+                        "Units": pd.Series(dtype=object), "Date": pd.Series(dtype="datetime64[us]"),
+                        "Note": pd.Series(dtype=object) })
+    return df
+
+backends = { "csv": CsvBackend, "parquet": ParquetBackend, "sqlite": SqliteBackend }
+
+def get_backend(email, name=None):
+    if name is not None: return backends[name](email)
+    for cls in (SqliteBackend, ParquetBackend, CsvBackend):
+        backend = cls(email)
+        if backend.exists(): return backend
+    return backends[DEFAULT_BACKEND](email)
+
+def compact_frame(df):
+    # In-memory form of loaded rows: Name, Units and Note become categoricals, so each row
+    # holds small integer codes instead of Python strings (notes are nearly all empty, so
+    # they cost one code per row). Value stays float64, since loaded frames are written
+    # back on rewrites and float32 would change the stored readings.
+    return df.astype({ "Name": "category", "Units": "category", "Note": "category" })
+
+def load_health_data(email, names=None, start=None, end=None):
+    # The unfiltered frame is cached process-wide and shared by every session of the user,
+    # so callers must not modify it (copy-on-write pandas copies on modification anyway).
+    backend = get_backend(email)
+    if names is not None or start is not None or end is not None:
+        return compact_frame(backend.read(names, start, end))  # Filtered reads are pushed down, not cached
+    return cache.health_data.get(email, "health_data", backend.files(), lambda: compact_frame(backend.read()))
+
+def append_entries(email, new_df):
+    get_backend(email).append(new_df)
+    cache.health_data.invalidate(email, "health_data")
+
+def replace_health_data(email, df):
+    get_backend(email).replace(df)
+    cache.health_data.invalidate(email, "health_data")
+
+def create_user_data(email):
+    get_backend(email).create()
+    cache.health_data.invalidate(email, "health_data")
+
+def compact(email):
+    merged = get_backend(email).compact()
+    cache.health_data.invalidate(email, "health_data")
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact appended health data segments into the base store.")
+    parser.add_argument("emails", nargs="*", help="Users to compact (default: all users under data/)")
+    args = parser.parse_args()
+    emails = args.emails or sorted(e for e in os.listdir("data") if os.path.isdir(f"data/{e}"))
+    for email in emails:
+        print(f"{email}: merged {compact(email)} segment(s)")
@@ -1,125 +1,97 @@
-import altair as alt
 import auth
+import cache
 import home
 import new_entry
 import os
 import pandas as pd
+import recompute
+import rollups
 import settings
+import storage
 import streamlit as st
+import timing
+import views
 
 # Show the page title and description.
 st.set_page_config(page_title="Health Manager", page_icon="❤️", layout="wide")
 st.title("Health Manager ❤️")
+timing.begin()  # Per-rerun stage timings (HEALTH_DEBUG panel / HEALTH_TRACE_LOG)
+run_counts = timing.count("app")
 
-if not auth.check_password(): st.stop()
+if not auth.check_password():
+    timing.end()
+    st.stop()
 #st.session_state["email"] = "hiangswee"  # Default email for demo purposes
 
-# Load the data from a CSV. We're caching this so it doesn't reload every time the app
-# reruns (e.g. if the user interacts with the widgets).
-#@st.cache_data
+# Load the data from the base CSV plus its appended segments. We're caching this so it
+# doesn't reload every time the app reruns (e.g. if the user interacts with the widgets).
+# The cache is checked against the files' mtime/size and invalidated explicitly by writers.
 def load_data():
-    df = pd.read_csv(f"data/{st.session_state['email']}/health_data.csv")
-    df["Date"] = pd.to_datetime(df["Date"])  # Convert 'date' column to datetime
-    return df
+    return storage.load_health_data(st.session_state["email"])
 
-df = load_data()
+# Derived rows follow the user's current settings and formulas; checked once per session
+# (and after each settings save) since it reads the full history when they differ.
+if not st.session_state.get("derived_checked"):
+    with timing.span("recompute"):
+        recompute.ensure_current(st.session_state["email"])
+    st.session_state["derived_checked"] = True
 
 page = st.sidebar.radio(
     "Menu",
     ("Home", "New Entry", "Settings"),
     index=st.session_state.get("menu_index", 0),
 )
+if os.environ.get("HEALTH_DEBUG"):
+    stats = cache.health_data.stats()
+    st.sidebar.caption(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['users']}/{stats['max_users']} users, {stats['entries']} entries")
+debug_panel = st.sidebar.empty()  # Filled with this rerun's timings at the end
 
 if page == "New Entry":
-    settings_file = f"data/{st.session_state["email"]}/settings.json"
+    settings_file = f"data/{st.session_state['email']}/settings.json"
     if not os.path.exists(settings_file):
         st.session_state["settings_msg"] = "Please set your height before adding new entries."
         st.session_state["menu_index"] = 2  # Set index to Settings
+        timing.end(debug_panel, page=page, runs=run_counts)
         st.rerun()
     else:
-        new_entry.show(df)
+        new_entry.show()
+    timing.end(debug_panel, page=page, runs=run_counts)
     st.stop()  # Stop here so the rest of the app doesn't run
 elif page == "Settings":
     settings.show()
+    with timing.span("recompute"):
+        stats = recompute.ensure_current(st.session_state["email"])
+    if stats and stats["derived"]:
+        st.success(f"Recomputed derived metrics: {stats['changed']:,} of {stats['derived']:,} rows updated "
+                   f"({stats['rows_per_sec']:,.0f} rows/s)")
+    timing.end(debug_panel, page=page, runs=run_counts)
     st.stop()  # Stop here so the rest of the app doesn't run
 
-if st.session_state.get("rerun", False) == True:
-    st.session_state["rerun"] = False  # Reset rerun flag
-    st.rerun()
+# Only Home reads the history; New Entry and Settings stopped above without loading it.
+with timing.span("load_data") as sp:
+    df = load_data()
+    sp.rows = len(df)
 
-names = home.show_measurement_selection(df)
+with timing.span("wide_view"):
+    view = views.wide_view(st.session_state["email"], df)  # Maintained Date x Name pivot
 
-start_date, end_date, show_ma = home.show_date_selection(df)
+names = home.show_measurement_selection(df, view)
 
-# Filter the dataframe based on the widget input and reshape it.
-df_filtered = df[
-    (df["Name"].isin(names)) &
-    (df["Date"].between(pd.Timestamp(start_date), pd.Timestamp(end_date+pd.DateOffset(days=1))))
-]
+start_date, end_date, resolution = home.show_date_selection(view)
 
-# Display the data as an Altair chart using `st.altair_chart`.
-df_reshaped = df_filtered.pivot_table(index="Date", columns="Name", values="Value", aggfunc="mean")
-df_reshaped = df_reshaped.sort_index().ffill()
-df_chart = pd.melt(
-    df_reshaped.reset_index(), id_vars="Date", var_name="Name", value_name="Value"
-)
-chart = (
-    alt.Chart(df_chart)
-    .mark_line()
-    .encode(
-        x=alt.X("Date:T"), # axis=alt.Axis(format="%Y-%m-%d")
-        y=alt.Y("Value:Q"),
-        color=alt.Color("Name:N", legend=alt.Legend(title="Measurement", orient="bottom")),  # Legend at bottom
-    )
-    .properties(height=600)
-)
-# Calculate 1-month (30-day) moving average for each measurement
-df_ma = df_reshaped.rolling(window='30D', min_periods=1).mean()
-df_ma_chart = pd.melt(
-    df_ma.reset_index(), id_vars="Date", var_name="Name", value_name="Value"
-)
-ma_chart = (
-    alt.Chart(df_ma_chart)
-    .mark_line(strokeDash=[5,5], opacity=0.7)
-    .encode(
-        x=alt.X("Date:T"),
-        y=alt.Y("Value:Q"),
-        color=alt.Color("Name:N", legend=None),
-    )
-)
-if show_ma:
-    st.altair_chart(chart + ma_chart, use_container_width=True)
-else:
-    st.altair_chart(chart, use_container_width=True)
+# Slice the wide view, or the rollups at the selected resolution, based on the widget input.
+range_start, range_end = pd.Timestamp(start_date), pd.Timestamp(end_date+pd.DateOffset(days=1))
+freq = rollups.resolve(resolution, range_start, range_end)
+if freq is not None:
+    with timing.span("rollup"):
+        rollup = rollups.rollup(st.session_state["email"], freq, df)
+with timing.span("slice_ffill") as sp:
+    if freq is None: df_reshaped = view.slice(range_start, range_end, names)
+    else: df_reshaped = rollup.slice(range_start, range_end, names)
+    df_reshaped = df_reshaped.ffill()
+    sp.rows = len(df_reshaped)
 
-# Display the data as a table using `st.dataframe`.
-preset_order = [
-    "Date", "Weight", "BMI", 
-    "Body Fat", "Body Fat %", "Subcutaneous Fat", "Subcutaneous Fat %", "Visceral Fat", "Visceral Fat %", "Visceral Fat Index",
-    "Muscle Mass", "Muscle Mass %", "Skeletal Muscle", "Skeletal Muscle %", "Bone Mass", "Bone Mass %", 
-    "Protein", "Protein %", "Body Water", "Body Water %", "BMR", "Metabolic Age",
-    "Cholesterol", "Triglycerides", "HDL", "LDL", "TC-HDL", "TC/HDL", 
-    "Glucose", "Ketone", "Dr. Boz Ratio", 
-    "Systolic", "Diastolic", "Pulse",
-    "Uric Acid", "Haematocrit", "Haemoglobin",
-]
-df_reshaped = df_reshaped.sort_values(by="Date", ascending=False)
-df_display = df_reshaped.copy()
-df_display.index = df_display.index.strftime("%Y-%m-%d")  # Format index if 'date' is index
-df_display = df_display.reset_index()
-for col in df_display.columns:
-    if col != "Date":
-        df_display[col] = df_display[col].apply(lambda x: f"{x:.1f}" if pd.notnull(x) else "")
-desired_order = []
-for col in preset_order:
-    if col in df_display.columns:
-        desired_order.append(col)  # Append any preset columns that are not already in desired order
-for col in df_display.columns:
-    if col not in desired_order:
-        desired_order.append(col)  # Append any other columns that are not in the desired order
-st.dataframe(
-    df_display[desired_order],
-    use_container_width=True,
-    hide_index=True,  # Hide the index column
-)
-    
\ No newline at end of file
+# The chart and the paged table are fragments: their own widgets rerun only them.
+home.show_chart(st.session_state["email"], df, view, df_reshaped, names, range_start, range_end, freq)
+home.show_table(df_reshaped)
+timing.end(debug_panel, page=page, runs=run_counts)
@@ -0,0 +1,156 @@
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+
+# Per-rerun timing spans. Each rerun of streamlit_app.py opens a record (begin), stages
+# wrap themselves in span() or @traced, and end() closes the record: it fills the sidebar
+# debug panel (HEALTH_DEBUG) and appends one JSON line to HEALTH_TRACE_LOG. Spans nest,
+# and record their duration, an optional row count and the change in process RSS (which
+# includes other sessions' threads, so it is a hint, not an exact allocation).
+# With neither variable set, span() returns a shared no-op and @traced returns the
+# function unchanged, so instrumentation costs one flag check per stage. Run counts per
+# scope (count, scoped) are kept in session state whether or not timing is enabled.
+#   python timing.py trace.jsonl   # per-stage median/p95 over a log
+PANEL = bool(os.environ.get("HEALTH_DEBUG"))
+LOG_FILE = os.environ.get("HEALTH_TRACE_LOG")
+ENABLED = PANEL or bool(LOG_FILE)
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None  # Not Linux: memory deltas are left out
+
+class Span:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        record = getattr(_local, "record", None)
+        self.record = record
+        if record is None: return self
+        self.depth = len(record["stack"])
+        record["stack"].append(self.name)
+        self.rss = _rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record = self.record
+        if record is None: return False
+        ms = (time.perf_counter() - self.start) * 1000
+        rss = _rss()
+        record["stack"].pop()
+        record["spans"].append({
+            "name": self.name,
+            "depth": self.depth,
+            "start_ms": round((self.start - record["start"]) * 1000, 3),
+            "ms": round(ms, 3),
+            "rows": self.rows,
+            "mem_kb": (rss - self.rss) // 1024 if rss is not None and self.rss is not None else None,
+        })
+        return False
+
+class _NoopSpan:
+    rows = None
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_noop = _NoopSpan()
+
+def span(name, rows=None):
+    return Span(name, rows) if ENABLED else _noop
+
+def traced(name=None):
+    def decorate(fn):
+        if not ENABLED: return fn
+        label = name or f"{fn.__module__}.{fn.__name__}"
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def scoped(scope):
+    # For st.fragment bodies. A fragment also reruns on its own, without the script around
+    # it, so each run is counted, and a run with no record open is timed as its own record.
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            runs = count(scope)
+            if not ENABLED: return fn(*args, **kwargs)
+            if getattr(_local, "record", None) is not None:
+                with Span(scope):
+                    return fn(*args, **kwargs)
+            begin()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end(scope=scope, runs=runs)
+        return wrapper
+    return decorate
+
+def count(scope):
+    # Per-session run counts by scope ("app" or a fragment), to compare full and partial reruns.
+    import streamlit as st
+    counts = st.session_state.setdefault("run_counts", {})
+    counts[scope] = counts.get(scope, 0) + 1
+    return counts
+
+def begin():
+    if not ENABLED: return
+    _local.record = { "start": time.perf_counter(), "ts": time.time(), "stack": [], "spans": [] }
+
+def end(panel=None, **fields):
+    # Close the current rerun's record; fields (e.g. page) are added to the log line.
+    record = getattr(_local, "record", None)
+    if record is None: return None
+    _local.record = None
+    rss = _rss()
+    result = {
+        "ts": round(record["ts"], 3),
+        **fields,
+        "total_ms": round((time.perf_counter() - record["start"]) * 1000, 3),
+        "rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+        "spans": sorted(record["spans"], key=lambda s: s["start_ms"]),  # Parents before children
+    }
+    if LOG_FILE:
+        line = json.dumps(result) + "\n"
+        with _log_lock, open(LOG_FILE, "a") as f: f.write(line)
+    if PANEL and panel is not None: show_panel(panel, result)
+    return result
+
+def show_panel(panel, result):
+    import pandas as pd
+    import streamlit as st
+    rows = [{ "Stage": " " * s["depth"] + s["name"], "ms": s["ms"], "Rows": s["rows"], "Mem KB": s["mem_kb"] }
+            for s in result["spans"]]
+    with panel.container():
+        st.caption(f"Rerun: {result['total_ms']:.1f} ms, RSS {result['rss_mb']} MB")
+        if "runs" in result: st.caption("Runs: " + ", ".join(f"{k} {v}" for k, v in result["runs"].items()))
+        st.dataframe(pd.DataFrame(rows, columns=["Stage", "ms", "Rows", "Mem KB"]), hide_index=True,
+                     column_config={ "ms": st.column_config.NumberColumn("ms", format="%.1f") })
+
+def summarize(path):
+    import pandas as pd
+    with open(path) as f: records = [json.loads(line) for line in f if line.strip()]
+    spans = pd.DataFrame([{ **s, "rerun": i } for i, r in enumerate(records) for s in r["spans"]])
+    totals = pd.Series([r["total_ms"] for r in records], name="ms")
+    summary = spans.groupby("name", sort=False)["ms"].describe(percentiles=[0.5, 0.95])[["count", "50%", "95%", "max"]]
+    summary.loc["(rerun total)"] = [len(totals), totals.median(), totals.quantile(0.95), totals.max()]
+    return summary.rename(columns={ "50%": "median_ms", "95%": "p95_ms", "max": "max_ms" })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a HEALTH_TRACE_LOG file by stage.")
+    parser.add_argument("log", help="JSON lines written with HEALTH_TRACE_LOG set")
+    args = parser.parse_args()
+    print(summarize(args.log).round(2).to_string())
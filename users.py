@@ -0,0 +1,58 @@
+import cache
+import csv
+import locks
+import os
+import threading
+import storage
+
+# In-memory index of data/users.csv (email -> password) for O(1) login lookups. The index
+# is reloaded only when the file's mtime/size changes, and signups hold an in-process
+# lock plus an advisory file lock around read-check-write, so concurrent signups from
+# different sessions (or processes) cannot lose an account. The on-disk format is unchanged.
+USERS_FILE = "data/users.csv"
+
+class UserStore:
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self._users = {}
+        self._signature = None
+        self._lock = threading.RLock()
+
+    def _refresh(self):
+        sig = cache.signature([self.path])
+        if sig == self._signature: return
+        users = {}
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as f:
+                for row in csv.DictReader(f):
+                    users.setdefault(row["email"], row["password"])
+        self._users, self._signature = users, sig
+
+    def get_password(self, email):
+        with self._lock:
+            self._refresh()
+            return self._users.get(email)
+
+    def check(self, email, password):
+        stored = self.get_password(email)
+        return stored is not None and stored == password
+
+    def exists(self, email):
+        return self.get_password(email) is not None
+
+    def add(self, email, password):
+        # Returns False if the email is already registered.
+        with self._lock, locks.file_lock(f"{self.path}.lock"):
+            self._refresh()
+            if email in self._users: return False
+            users = dict(self._users)
+            users[email] = password
+            def write(f):
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(["email", "password"])
+                writer.writerows(users.items())
+            storage.atomic_write(self.path, write)
+            self._users, self._signature = users, cache.signature([self.path])
+            return True
+
+store = UserStore()
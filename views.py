@@ -0,0 +1,103 @@
+import cache
+import json
+import os
+import numpy as np
+import pandas as pd
+import storage
+
+# Wide (Date x measurement) view of a user's data, equivalent to
+#   df.pivot_table(index="Date", columns="Name", values="Value", aggfunc="mean")
+# It is kept as per-cell sums and counts so rows appended to the raw data can be folded
+# in without re-pivoting the history, and persisted to data/<email>/wide_view.parquet.
+class WideView:
+    def __init__(self, sums, counts, rows=0, checksum=0):
+        self.sums = sums
+        self.counts = counts
+        self.rows = rows  # Number of raw rows folded in, in storage order
+        self.checksum = checksum  # checksum() of those rows, to detect rewritten history
+        self.columns = list(sums.columns)
+
+    def mean(self):
+        return self.sums / self.counts.where(self.counts > 0)
+
+    def matches(self, df):
+        return self.rows <= len(df) and self.checksum == checksum(df, self.rows)
+
+    def extend(self, df):
+        # Fold in raw rows [self.rows:] and return a new view; self is shared, so never mutated.
+        new = df.iloc[self.rows:]
+        if new.empty: return self
+        new_sums = new.pivot_table(index="Date", columns="Name", values="Value", aggfunc="sum", observed=True)
+        new_counts = new.pivot_table(index="Date", columns="Name", values="Value", aggfunc="count", observed=True)
+        new_sums.columns = new_counts.columns = pd.Index(new_sums.columns.astype(object), name="Name")
+        if self.sums.empty:
+            sums, counts = new_sums, new_counts
+        elif new_sums.index.min() > self.sums.index.max():
+            sums, counts = pd.concat([self.sums, new_sums]), pd.concat([self.counts, new_counts])
+        else:
+            sums, counts = self.sums.add(new_sums, fill_value=0), self.counts.add(new_counts, fill_value=0)
+        columns = sorted(sums.columns)
+        sums = sums.reindex(columns=columns).fillna(0.0)
+        counts = counts.reindex(columns=columns).fillna(0).astype("int64")
+        return WideView(sums, counts, len(df), checksum(df, len(df)))
+
+    def slice(self, start=None, end=None, columns=None):
+        # Rows and columns with no readings in the slice are dropped, as pivot_table does.
+        if columns is not None: columns = [c for c in self.columns if c in set(columns)]
+        else: columns = self.columns
+        sums = self.sums.loc[start:end, columns]
+        counts = self.counts.loc[start:end, columns]
+        wide = sums / counts.where(counts > 0)
+        wide = wide.dropna(axis=0, how="all").dropna(axis=1, how="all")
+        wide.columns.name = "Name"
+        return wide
+
+def checksum(df, rows):
+    # Sum (mod 2^64) of per-row hashes of (Date, Name, Value) over the first rows, so a
+    # rewrite that changes a Date or Name without touching values is also detected.
+    head = df.iloc[:rows]
+    frame = pd.DataFrame({ "Date": head["Date"].to_numpy(dtype="datetime64[us]").view("int64"), "Name": head["Name"],
+                           "Value": head["Value"].to_numpy(dtype="float64", na_value=np.nan) })
+    return int(pd.util.hash_pandas_object(frame, index=False).to_numpy().sum(dtype="uint64"))
+
+def _empty_view():
+    index = pd.DatetimeIndex([], name="Date")
+    return WideView(pd.DataFrame(index=index, dtype="float64"), pd.DataFrame(index=index, dtype="int64"))
+
+def view_file(email):
+    return f"{storage.user_dir(email)}/wide_view.parquet"
+
+def _read_view(email):
+    import pyarrow.parquet as pq
+    try:
+        table = pq.read_table(view_file(email))
+    except (FileNotFoundError, OSError):
+        return None
+    meta = json.loads(table.schema.metadata[b"health_view"])
+    wide = table.to_pandas().set_index("Date")
+    sums = wide[[c for c in wide.columns if c.startswith("sum:")]]
+    counts = wide[[c for c in wide.columns if c.startswith("count:")]]
+    sums.columns = [c.split(":", 1)[1] for c in sums.columns]
+    counts.columns = [c.split(":", 1)[1] for c in counts.columns]
+    return WideView(sums, counts.astype("int64"), meta["rows"], meta["checksum"])
+
+def _write_view(email, view):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    wide = pd.concat([view.sums.add_prefix("sum:"), view.counts.add_prefix("count:")], axis=1)
+    wide.index.name = "Date"
+    table = pa.Table.from_pandas(wide.reset_index(), preserve_index=False)
+    meta = json.dumps({ "rows": view.rows, "checksum": view.checksum })
+    table = table.replace_schema_metadata({ **(table.schema.metadata or {}), b"health_view": meta.encode() })
+    storage.atomic_write(view_file(email), lambda f: pq.write_table(table, f), mode="wb")
+
+def wide_view(email, df=None):
+    # df is the user's full raw frame from storage.load_health_data (loaded if not given).
+    if df is None: df = storage.load_health_data(email)
+    def load():
+        view = cache.health_data.peek(email, "wide_view") or _read_view(email)
+        if view is None or not view.matches(df): view = _empty_view()  # History was rewritten
+        new_view = view.extend(df)
+        if new_view is not view or not os.path.exists(view_file(email)): _write_view(email, new_view)
+        return new_view
+    return cache.health_data.get(email, "wide_view", storage.get_backend(email).files(), load)